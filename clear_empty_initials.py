@@ -1,44 +1,34 @@
-import json
+from lead_store import LeadFile, lead_db
+from send_journal import compact
 
 INPUT_PATH = "leads/scraped_leads.ndjson"
-OUTPUT_PATH = "leads/scraped_leads.ndjson"
+EMAIL_FIELDS = ["email 1", "email 2", "email 3"]
 
-def read_pretty_ndjson(path):
-    records = []
-    buffer = ""
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            buffer += line
-            if line.strip().endswith("}"):
-                try:
-                    records.append(json.loads(buffer))
-                except Exception as e:
-                    print(f"Error parsing block: {e}")
-                buffer = ""
-    return records
-
-def write_pretty_ndjson(path, records):
-    with open(path, "w", encoding="utf-8") as f:
-        for r in records:
-            f.write(json.dumps(r, ensure_ascii=False, indent=2))
-            f.write("\n\n")
-
-def clean_emails(records):
-    for block in records:
-        if list(block.keys()) == ["website url"]:
-            continue  # untouched
-        if "initial date" in block and block["initial date"].strip():
-            continue  # keep as-is
-        # Clear email fields
-        for field in ["email 1", "email 2", "email 3"]:
-            if field in block:
-                block[field] = ""
-    return records
+def clean_email(block):
+    """Clear the drafted emails of a lead with no initial send. Returns True if any were set."""
+    if list(block.keys()) == ["website url"]:
+        return False  # untouched
+    if "initial date" in block and block["initial date"].strip():
+        return False  # keep as-is
+    changed = any(block.get(field) for field in EMAIL_FIELDS)
+    # Clear email fields
+    for field in EMAIL_FIELDS:
+        if field in block:
+            block[field] = ""
+    return changed
 
 if __name__ == "__main__":
-    data = read_pretty_ndjson(INPUT_PATH)
-    updated = clean_emails(data)
-    write_pretty_ndjson(OUTPUT_PATH, updated)
+    db = lead_db()
+    # a journaled initial send must be on its lead before this decides the lead is unsent
+    compact(INPUT_PATH, db=db)
+    if db:
+        with db:
+            for lead_id, block in db.select("initial_date = ''"):
+                if clean_email(block):
+                    db.update(lead_id, block)
+    else:
+        store = LeadFile(INPUT_PATH)
+        for block in store.leads:
+            clean_email(block)
+        store.save()
     print("[✓] Email fields cleared for blocks without 'initial date'.")
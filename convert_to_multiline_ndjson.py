@@ -2,6 +2,8 @@ import os
 import json
 import re
 
+from lead_store import open_leads, write_leads
+
 FLAT_PATH = "leads/scraped_leads.ndjson"
 NESTED_PATH = "leads/scraped_leads_nested.ndjson"
 
@@ -77,14 +79,12 @@ def convert_flat_to_nested(flat_path, nested_path):
         print(f"❌ File not found: {flat_path}")
         return
 
-    with open(flat_path, "r", encoding="utf-8") as f:
+    with open_leads(flat_path) as f:
         raw = f.read()
 
     records, skipped, whitespace_fixes = repair_ndjson(raw)
 
-    with open(nested_path, "w", encoding="utf-8") as fout:
-        for obj in records:
-            fout.write(json.dumps(obj, indent=2, ensure_ascii=False) + "\n\n")
+    write_leads(nested_path, records, pretty=True)
 
     print(f"✅ Converted {len(records)} records to nested NDJSON → {nested_path}")
     if skipped:
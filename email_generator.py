@@ -1,8 +1,10 @@
 import os
-import json
 import random
+from collections import Counter
 from dotenv import load_dotenv
 
+from lead_store import LeadFile, json_field, lead_db
+
 load_dotenv()
 
 LEADS_FILE = "leads/scraped_leads.ndjson"
@@ -401,34 +403,6 @@ rotators = {
     "fu2_p4": VariantRotator(fu2_paragraph_4_variants),
 }
 
-# --- NDJSON Helpers --------------------------------------------------------
-
-def load_ndjson(filepath):
-    records = []
-    buffer = ""
-    with open(filepath, "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                if buffer:
-                    try:
-                        records.append(json.loads(buffer))
-                    except json.JSONDecodeError as e:
-                        print(f"❌ JSON decode error:\n{buffer}\n→ {e}")
-                    buffer = ""
-            else:
-                buffer += line
-        if buffer:
-            try:
-                records.append(json.loads(buffer))
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON decode error at EOF:\n{buffer}\n→ {e}")
-    return records
-
-def save_ndjson(filepath, records):
-    with open(filepath, "w", encoding="utf-8") as f:
-        for record in records:
-            f.write(json.dumps(record, ensure_ascii=False, indent=2) + "\n")
-
 # --- Email Builders --------------------------------------------------------
 
 def build_email1(lead):
@@ -475,38 +449,41 @@ def build_email3(lead):
 
 # --- Main ------------------------------------------------------------------
 
-def main():
-    leads = load_ndjson(LEADS_FILE)
-    updated1 = updated2 = updated3 = 0
-
-    for lead in leads:
-        # Skip leads that only have "website url" and nothing else useful
-        if set(lead.keys()) == {"website url"}:
-            continue
-
-        if not lead.get("email 1", "").strip():
+def fill_emails(lead):
+    """Write whichever of the lead's three emails are still empty. Returns the numbers written."""
+    built = []
+    for n, build in ((1, build_email1), (2, build_email2), (3, build_email3)):
+        if not lead.get(f"email {n}", "").strip():
             try:
-                lead["email 1"] = build_email1(lead)
-                updated1 += 1
+                lead[f"email {n}"] = build(lead)
+                built.append(n)
             except Exception as e:
-                print(f"⚠️ Skipping email 1 for {lead.get('website url', '[no url]')}: {e}")
+                print(f"⚠️ Skipping email {n} for {lead.get('website url', '[no url]')}: {e}")
+    return built
 
-        if not lead.get("email 2", "").strip():
-            try:
-                lead["email 2"] = build_email2(lead)
-                updated2 += 1
-            except Exception as e:
-                print(f"⚠️ Skipping email 2 for {lead.get('website url', '[no url]')}: {e}")
-
-        if not lead.get("email 3", "").strip():
-            try:
-                lead["email 3"] = build_email3(lead)
-                updated3 += 1
-            except Exception as e:
-                print(f"⚠️ Skipping email 3 for {lead.get('website url', '[no url]')}: {e}")
-
-    save_ndjson(LEADS_FILE, leads)
-    print(f"✅ Done: {updated1} email 1s, {updated2} email 2s, {updated3} email 3s generated.")
+def main():
+    updated = Counter()
+    db = lead_db()
+    if db:
+        missing = " OR ".join(f"coalesce(trim({json_field(f'email {n}')}), '') = ''" for n in (1, 2, 3))
+        with db:
+            for lead_id, lead in db.select(missing):
+                # Skip leads that only have "website url" and nothing else useful
+                if set(lead.keys()) == {"website url"}:
+                    continue
+                built = fill_emails(lead)
+                if built:
+                    db.update(lead_id, lead)
+                    updated.update(built)
+    else:
+        store = LeadFile(LEADS_FILE)
+        for lead in store.leads:
+            # Skip leads that only have "website url" and nothing else useful
+            if set(lead.keys()) == {"website url"}:
+                continue
+            updated.update(fill_emails(lead))
+        store.save()
+    print(f"✅ Done: {updated[1]} email 1s, {updated[2]} email 2s, {updated[3]} email 3s generated.")
 
 if __name__ == "__main__":
     main()
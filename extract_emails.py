@@ -1,5 +1,4 @@
 import os
-import json
 import re
 import requests
 import urllib3
@@ -7,6 +6,8 @@ from urllib.parse import urlparse as original_urlparse, urljoin
 from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
 import warnings
 
+from lead_store import iter_leads, lead_db
+
 # === Warnings & Patching ===
 warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -104,25 +105,17 @@ def collect_relevant_links(index_html, base_url, domain):
 
     return list(dict.fromkeys(eligible))[:20], skipped
 
-def read_multiline_ndjson(path):
-    with open(path, "r", encoding="utf-8") as f:
-        buffer = ""
-        for line in f:
-            if not line.strip():
-                continue
-            buffer += line
-            if line.strip().endswith("}"):
-                try:
-                    yield json.loads(buffer)
-                except:
-                    pass
-                buffer = ""
-
 # === Main ===
 def main():
-    if not os.path.exists(INPUT_PATH):
+    db = lead_db()
+    if db:
+        # leads that already have an email or lack a website would only be skipped
+        records = [record for _, record in db.select("email = '' AND domain != ''")]
+    elif not os.path.exists(INPUT_PATH):
         print(f"❌ Input file not found: {INPUT_PATH}")
         return
+    else:
+        records = iter_leads(INPUT_PATH)
 
     matches = set()
     total_checked = 0
@@ -131,7 +124,7 @@ def main():
 
     print("📥 Starting email scraping from leads...\n")
 
-    for i, record in enumerate(read_multiline_ndjson(INPUT_PATH), 1):
+    for i, record in enumerate(records, 1):
         first = record.get("first name", "").strip().lower()
         last = record.get("last name", "").strip().lower()
         website_url = record.get("website url", "").strip()
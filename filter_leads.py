@@ -1,33 +1,24 @@
-import json
-import os
+from lead_store import LeadFile, json_field, lead_db
+from send_journal import compact
 
 INPUT_PATH = "leads/scraped_leads.ndjson"
-TEMP_PATH = "leads/scraped_leads.filtered.ndjson"
-
-def read_multiline_ndjson(path):
-    buffer, records = "", []
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            buffer += line
-            if line.strip() == "}":
-                try:
-                    records.append(json.loads(buffer))
-                except Exception as e:
-                    print(f"❌ Skipping invalid record: {e}")
-                buffer = ""
-    return records
-
-def write_ndjson(records, path):
-    with open(path, "w", encoding="utf-8") as f:
-        for record in records:
-            json.dump(record, f, ensure_ascii=False, indent=2)
-            f.write("\n")
 
 def filter_leads():
+    db = lead_db()
+    # dropping a lead renumbers the repeats of its email, which journal keys count on
+    compact(INPUT_PATH, db=db)
+    if db:
+        with db:
+            removed_missing_web_copy = db.delete(f"coalesce(trim({json_field('web copy')}), '') = ''")
+            removed_missing_email = db.delete("email = ''")
+        print(f"🧹 Removed {removed_missing_web_copy} leads missing 'web copy'")
+        print(f"🧹 Removed {removed_missing_email} leads missing 'email'")
+        print(f"✅ Done: {db.count()} eligible leads left in {db.path}.")
+        return
+
     print("🔍 Loading leads...")
-    records = read_multiline_ndjson(INPUT_PATH)
+    store = LeadFile(INPUT_PATH)
+    records = store.leads
 
     filtered = []
     removed_missing_web_copy = 0
@@ -51,8 +42,8 @@ def filter_leads():
     print(f"🧹 Removed {removed_missing_email} leads missing 'email'")
     print(f"💾 Saving {len(filtered)} eligible leads...")
 
-    write_ndjson(filtered, TEMP_PATH)
-    os.replace(TEMP_PATH, INPUT_PATH)
+    store.leads = filtered
+    store.save()
     print("✅ Done.")
 
 if __name__ == "__main__":
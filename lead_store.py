@@ -0,0 +1,547 @@
+"""
+The one reader and writer for the leads file (leads/scraped_leads.ndjson).
+
+The file is a sequence of JSON objects separated by whitespace. write_leads() stores
+one compact object per line, optionally gzip- or lzma-compressed; older files hold
+indent=2 records, which read the same way. iter_leads() recognizes a compressed file
+by its magic bytes and streams the records with json.JSONDecoder.raw_decode over a
+buffered reader, so memory stays at one record (plus a read chunk) however large the
+file is, and a record's boundaries come from the JSON itself rather than from how its
+lines look. A block that doesn't parse is reported with its line number and skipped up
+to the next record, which starts at the first "{" opening a line.
+
+With LEADS_DB set to a SQLite file, that database is the store of record instead (see
+LeadDB): each record is kept as the same JSON object, alongside indexed columns for the
+fields the stages look leads up by, so they query and update single rows rather than
+reading and rewriting the whole file. NDJSON stays the interchange format; scraper.js
+still works on the file, so run it between an export and an import.
+
+    python lead_store.py pretty [path] [out]             indent=2 copy for review (default: stdout)
+    python lead_store.py compact [path] [gzip|lzma|none]  rewrite in place, optionally changing compression
+    python lead_store.py import [path] [db]              replace the database's leads with the file's
+    python lead_store.py export [db] [path]              write the database's leads to the file
+    python lead_store.py get [path] KEY                  print leads by "#n", email (or email#n) or domain
+"""
+import gzip
+import json
+import lzma
+import mmap
+import os
+import re
+import sqlite3
+import sys
+import zlib
+
+LEADS_FILE = "leads/scraped_leads.ndjson"
+# compression for a leads file written for the first time ("gzip", "lzma" or "none");
+# rewriting an existing file keeps the compression it has
+LEADS_COMPRESSION = os.environ.get("LEADS_COMPRESSION", "none").strip().lower() or "none"
+COMPRESSIONS = ("none", "gzip", "lzma")
+LEADS_DB = os.environ.get("LEADS_DB", "").strip()
+MAGIC = {b"\x1f\x8b": "gzip", b"\xfd7zXZ\x00": "lzma"}
+READ_CHUNK = 1 << 16
+WHITESPACE = re.compile(r"\s*")
+INDEX_VERSION = 2  # bump when LeadIndex's record split changes, so old sidecars are rebuilt
+
+_decoder = json.JSONDecoder()
+
+def detect_compression(path):
+    """"gzip" or "lzma" from the file's first bytes, else "none" (also for a missing file)."""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(6)
+    except FileNotFoundError:
+        return "none"
+    return next((name for magic, name in MAGIC.items() if head.startswith(magic)), "none")
+
+def open_leads(path, mode="r", compression=None):
+    """Text-mode file object for `path`, compressed as given or, by default, as detected."""
+    if compression is None:
+        compression = detect_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    if compression == "lzma":
+        return lzma.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def iter_leads(path=LEADS_FILE, errors=None):
+    """
+    Yield the records of `path` in file order. Unreadable blocks are printed and skipped;
+    pass a list as `errors` to also collect them as (line, message) pairs.
+    """
+    with open_leads(path) as f:
+        buf, pos, line, eof = "", 0, 1, False
+        scanned = 0  # buf[:scanned] holds no record boundary past pos
+        while True:
+            pos = WHITESPACE.match(buf, pos).end()
+            boundary = buf.find("\n{", max(pos, scanned))
+            if boundary < 0 and not eof:
+                # the record at pos may not be complete yet: keep it and read on
+                line += buf.count("\n", 0, pos)
+                buf = buf[pos:]
+                scanned = max(0, len(buf) - 1)
+                pos = 0
+                chunk = f.read(READ_CHUNK)
+                eof = not chunk
+                buf += chunk
+                continue
+            if pos == len(buf):
+                return
+            try:
+                record, end = _decoder.raw_decode(buf, pos)
+            except ValueError as e:
+                record, end, problem = None, boundary + 1 if boundary >= 0 else len(buf), e.msg
+            else:
+                problem = None if isinstance(record, dict) else f"expected an object, got {type(record).__name__}"
+            if problem:
+                at = line + buf.count("\n", 0, pos)
+                print(f"[Leads] Skipping unreadable record at line {at} of {path}: {problem}")
+                if errors is not None:
+                    errors.append((at, problem))
+            else:
+                yield record
+            pos = end
+            scanned = pos
+
+def read_leads(path=LEADS_FILE, errors=None):
+    """Every record of `path` as a list; see iter_leads()."""
+    return list(iter_leads(path, errors))
+
+def write_leads(path, records, compression=None, pretty=False):
+    """
+    Write `records` (any iterable) one compact object per line, or indent=2 with `pretty`,
+    and swap the file in atomically, so a crash never leaves a half-written file. Because
+    the old file stays in place until the end, records may be streamed straight from
+    iter_leads() on the same path. `compression` defaults to the existing file's, or
+    LEADS_COMPRESSION for a new one. Returns the number written.
+    """
+    if compression is None:
+        compression = detect_compression(path) if os.path.exists(path) else LEADS_COMPRESSION
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown leads compression {compression!r}; use one of {', '.join(COMPRESSIONS)}")
+    layout = {"indent": 2} if pretty else {"separators": (",", ":")}
+    tmp_path = path + ".tmp"
+    count = 0
+    with open_leads(tmp_path, "w", compression) as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, **layout) + "\n")
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+def export_pretty(path=LEADS_FILE, out=None):
+    """Uncompressed indent=2 copy of the leads for reading or diffing by hand; to stdout without `out`."""
+    if out:
+        return write_leads(out, iter_leads(path), compression="none", pretty=True)
+    count = 0
+    for record in iter_leads(path):
+        sys.stdout.write(json.dumps(record, ensure_ascii=False, indent=2) + "\n")
+        count += 1
+    return count
+
+# === SQLite store ===
+def lead_domain(url):
+    """Website domain as the stages compare it: lowercased host without scheme or "www."."""
+    url = str(url or "").lower().strip()
+    url = re.sub(r"^https?://", "", url)
+    return url.split("/")[0].replace("www.", "")
+
+def _text(value):
+    return str(value or "").strip()
+
+# indexed column -> value for a record; everything else is only in the JSON
+INDEXED_COLUMNS = {
+    "email": lambda r: _text(r.get("email")).lower(),
+    "domain": lambda r: lead_domain(r.get("website url")),
+    "initial_date": lambda r: _text(r.get("initial date")),
+    "fu1_date": lambda r: _text(r.get("follow-up 1 date")),
+    "fu2_date": lambda r: _text(r.get("follow-up 2 date")),
+    "reply": lambda r: _text(r.get("reply")),
+}
+
+def json_field(name):
+    """SQL expression for a record field with no column of its own, e.g. json_field("web copy")."""
+    return "json_extract(record, '$.\"%s\"')" % name.replace("'", "''").replace('"', '\\"')
+
+class LeadDB:
+    """
+    Leads in SQLite: table `leads` holds each record as JSON in `record`, in file order by
+    `id`, plus the INDEXED_COLUMNS (normalized email, website domain, the three send
+    dates and reply), each indexed. Queries take a WHERE clause over those columns or
+    json_field(); writes go through update() / insert() / delete() inside `with db:`,
+    which is one transaction.
+    """
+
+    def __init__(self, path=None, create=False):
+        self.path = path or LEADS_DB
+        if not create and not os.path.exists(self.path):
+            raise FileNotFoundError(f"No lead database at {self.path}; create it with `python lead_store.py import`")
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        columns = "".join(f", {name} TEXT NOT NULL" for name in INDEXED_COLUMNS)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS leads (id INTEGER PRIMARY KEY, record TEXT NOT NULL{columns})")
+        for name in INDEXED_COLUMNS:
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS leads_{name} ON leads({name})")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self.conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self.conn.__exit__(*exc)
+
+    def close(self):
+        self.conn.close()
+
+    def select(self, where="1", params=()):
+        """[(id, record)] matching `where`, in file order."""
+        rows = self.conn.execute(f"SELECT id, record FROM leads WHERE {where} ORDER BY id", params)
+        return [(lead_id, json.loads(record)) for lead_id, record in rows]
+
+    def count(self, where="1", params=()):
+        return self.conn.execute(f"SELECT count(*) FROM leads WHERE {where}", params).fetchone()[0]
+
+    def leads(self):
+        """Every record, in file order, like read_leads()."""
+        return [record for _, record in self.select()]
+
+    def _row(self, record):
+        return (json.dumps(record, ensure_ascii=False, separators=(",", ":")),
+                *(value(record) for value in INDEXED_COLUMNS.values()))
+
+    def update(self, lead_id, record):
+        assignments = ", ".join(f"{name} = ?" for name in ("record", *INDEXED_COLUMNS))
+        self.conn.execute(f"UPDATE leads SET {assignments} WHERE id = ?", (*self._row(record), lead_id))
+
+    def insert(self, record):
+        names = ", ".join(("record", *INDEXED_COLUMNS))
+        marks = ", ".join("?" * (1 + len(INDEXED_COLUMNS)))
+        return self.conn.execute(f"INSERT INTO leads ({names}) VALUES ({marks})", self._row(record)).lastrowid
+
+    def delete(self, where, params=()):
+        """Delete the leads matching `where`. Returns how many."""
+        return self.conn.execute(f"DELETE FROM leads WHERE {where}", params).rowcount
+
+    def import_ndjson(self, path=LEADS_FILE):
+        """Replace every lead with the records of `path`, in one transaction. Returns the count."""
+        count = 0
+        with self.conn:
+            self.conn.execute("DELETE FROM leads")
+            for record in iter_leads(path):
+                self.insert(record)
+                count += 1
+        return count
+
+    def export_ndjson(self, path=LEADS_FILE):
+        rows = self.conn.execute("SELECT record FROM leads ORDER BY id")
+        return write_leads(path, (json.loads(record) for record, in rows))
+
+def lead_db():
+    """The LEADS_DB database when one is configured, else None (the stages use the leads file)."""
+    return LeadDB(LEADS_DB) if LEADS_DB else None
+
+# === Sidecar index ===
+class LeadIndex:
+    """
+    Random access into an uncompressed leads file through a sidecar index at
+    `path + ".idx"`: for each record, its byte offset and length with its normalized email
+    and website domain. refresh() (run on open) brings the index up to date when the
+    file's size or mtime has changed; if the file only grew and its last indexed record
+    is byte-for-byte intact, only the bytes after it are scanned, otherwise it is rebuilt.
+    Records are read through mmap, so read(n) parses that record and nothing else.
+    Use as a context manager, or close() it.
+    """
+
+    def __init__(self, path=LEADS_FILE):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.size = self.mtime_ns = self.tail_crc = 0
+        self.skipped = 0  # unreadable blocks left out of the index
+        self.records = []  # [offset, length, email, domain] in file order
+        self._file = self._map = None
+        self._by_email = self._by_domain = None
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("version") != INDEX_VERSION:
+                raise ValueError("index from an older version")
+            self.size, self.mtime_ns = saved["size"], saved["mtime_ns"]
+            self.tail_crc, self.records = saved["tail_crc"], saved["records"]
+            self.skipped = saved["skipped"]
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[Leads] Ignoring unreadable index {self.index_path}: {e}")
+        self.refresh()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.records)
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+        self._file = self._map = None
+
+    def refresh(self):
+        """Re-index whatever changed since the index was saved. Returns the number of records scanned."""
+        stat = os.stat(self.path)
+        if self._map is not None and (stat.st_size, stat.st_mtime_ns) == (self.size, self.mtime_ns):
+            return 0
+        if detect_compression(self.path) != "none":
+            raise ValueError(f"{self.path} is compressed and can't be indexed; "
+                             f"`python lead_store.py compact {self.path} none` stores it plainly")
+        self.close()
+        self._file = open(self.path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        if (stat.st_size, stat.st_mtime_ns) == (self.size, self.mtime_ns):
+            return 0
+        start = 0
+        if self.records and stat.st_size >= self.size and self._crc(self.records[-1]) == self.tail_crc:
+            start = self.records[-1][0] + self.records[-1][1]
+        else:
+            self.records, self.skipped = [], 0
+        scanned = self._scan(start)
+        self.size, self.mtime_ns = stat.st_size, stat.st_mtime_ns
+        self.tail_crc = self._crc(self.records[-1]) if self.records else 0
+        self._by_email = self._by_domain = None
+        self._save()
+        return scanned
+
+    def rebuild(self):
+        """Index the file from scratch, e.g. after it was rewritten whole. Returns the number of records."""
+        self.records, self.skipped = [], 0
+        self.size = self.mtime_ns = self.tail_crc = 0
+        return self.refresh()
+
+    def _crc(self, entry):
+        offset, length = entry[0], entry[1]
+        return zlib.crc32(self._map[offset:offset + length]) if offset + length <= len(self._map) else -1
+
+    def _scan(self, pos):
+        # the same split as iter_leads(): raw_decode within each block up to the next "{"
+        # opening a line, so "}{" on one line is two records and junk skips to the boundary
+        data, end, scanned = self._map, len(self._map), 0
+        while pos < end:
+            boundary = data.find(b"\n{", pos)
+            stop = end if boundary < 0 else boundary
+            try:
+                text = data[pos:stop].decode("utf-8")
+            except UnicodeDecodeError as e:
+                text, at, problem = "", 0, str(e)
+            else:
+                at, problem = 0, None
+            offset = pos  # byte offset of text[at]
+            while problem is None:
+                skip = WHITESPACE.match(text, at).end()
+                offset += len(text[at:skip].encode("utf-8"))
+                at = skip
+                if at == len(text):
+                    break
+                try:
+                    record, next_at = _decoder.raw_decode(text, at)
+                except ValueError as e:
+                    problem = e.msg
+                    break
+                length = len(text[at:next_at].encode("utf-8"))
+                if isinstance(record, dict):
+                    self.records.append([offset, length, INDEXED_COLUMNS["email"](record),
+                                         INDEXED_COLUMNS["domain"](record)])
+                    scanned += 1
+                else:
+                    print(f"[Leads] Not indexing unreadable record at byte {offset} of {self.path}: "
+                          f"expected an object, got {type(record).__name__}")
+                    self.skipped += 1
+                offset, at = offset + length, next_at
+            if problem is not None:
+                print(f"[Leads] Not indexing unreadable record at byte {offset} of {self.path}: {problem}")
+                self.skipped += 1
+            pos = stop + 1
+        return scanned
+
+    def _save(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "size": self.size, "mtime_ns": self.mtime_ns,
+                       "tail_crc": self.tail_crc, "skipped": self.skipped, "records": self.records}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.index_path)
+
+    def read(self, n):
+        """Record number `n` (0-based, file order)."""
+        offset, length = self.records[n][:2]
+        return json.loads(self._map[offset:offset + length])
+
+    def find_email(self, email):
+        """Record numbers of the leads with this email, in file order."""
+        if self._by_email is None:
+            self._by_email = {}
+            for n, entry in enumerate(self.records):
+                self._by_email.setdefault(entry[2], []).append(n)
+        return self._by_email.get(str(email).strip().lower(), []) if email else []
+
+    def find_domain(self, domain):
+        """Record numbers of the leads whose website is on `domain`, in file order."""
+        if self._by_domain is None:
+            self._by_domain = {}
+            for n, entry in enumerate(self.records):
+                self._by_domain.setdefault(entry[3], []).append(n)
+        return self._by_domain.get(lead_domain(domain), []) if domain else []
+
+    def replace_tail(self, first, entries):
+        """After the file was rewritten from record `first` on, adopt `entries` for those records and save."""
+        self.close()
+        self.records[first:] = entries
+        stat = os.stat(self.path)
+        self._file = open(self.path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        self.size, self.mtime_ns = stat.st_size, stat.st_mtime_ns
+        self.tail_crc = self._crc(self.records[-1]) if self.records else 0
+        self._by_email = self._by_domain = None
+        self._save()
+
+    def find_key(self, key):
+        """Record number for a send-journal key ("email", or "email#n" for its n-th lead), else None."""
+        email, sep, n = key.rpartition("#")
+        if not (sep and n.isdigit()):
+            email, n = key, "1"
+        matches = self.find_email(email)
+        return matches[int(n) - 1] if 0 < int(n) <= len(matches) else None
+
+# === Editing ===
+class LeadFile:
+    """
+    A leads file loaded for editing. Change records in `leads` (set or delete fields,
+    drop, reorder or append records) and save() writes back only what changed: the bytes
+    up to the first changed record and the unchanged records after it are copied byte for
+    byte, only changed records are serialized, and the result is swapped in atomically,
+    so a run that changed nothing writes nothing, a crash mid-save leaves the old file
+    whole, and a git diff of the file shows just the changed records. Records are compared
+    field by field against a copy taken at load, so replace a field's value rather than
+    mutating a nested one. Compressed files can't be patched and are rewritten whole, as
+    is a file with unreadable blocks (which drops them, as read_leads() skips them).
+    """
+
+    def __init__(self, path=LEADS_FILE):
+        self.path = path
+        if detect_compression(path) == "none":
+            self.index = LeadIndex(path)
+            self.leads = [self.index.read(n) for n in range(len(self.index))]
+        else:
+            self.index = None
+            self.leads = read_leads(path)
+        self._mark()
+
+    def _mark(self):
+        self._loaded = list(self.leads)
+        self._snapshot = [dict(lead) for lead in self.leads]
+        self._stat = os.stat(self.path)
+
+    def first_dirty(self):
+        """Position of the first record that differs from the file, or None if nothing does."""
+        for i, lead in enumerate(self.leads):
+            if i >= len(self._loaded) or lead is not self._loaded[i] or lead != self._snapshot[i]:
+                return i
+        return None if len(self.leads) == len(self._loaded) else len(self.leads)
+
+    def save(self):
+        """Write back the changed records. Returns how many records were rewritten; 0 when nothing changed."""
+        first = self.first_dirty()
+        if first is None:
+            return 0
+        stat = os.stat(self.path)
+        if (stat.st_size, stat.st_mtime_ns) != (self._stat.st_size, self._stat.st_mtime_ns):
+            raise RuntimeError(f"{self.path} changed on disk since it was loaded; not overwriting it")
+        if self.index is None or self.index.skipped:
+            # unreadable blocks sit between indexed records, so offsets alone can't say
+            # where a changed record ends; rewrite the whole file as read_leads() sees it
+            written = write_leads(self.path, self.leads)
+            if self.index is not None:
+                self.index.rebuild()
+        else:
+            written = self._patch(first)
+        self._mark()
+        return written
+
+    def _patch(self, first):
+        entries = self.index.records
+        if first < len(entries):
+            start, parts = entries[first][0], []
+        elif entries:
+            start, parts = entries[-1][0] + entries[-1][1], [b"\n"]
+        else:
+            start, parts = 0, []
+        loaded_at = {id(lead): n for n, lead in enumerate(self._loaded)}
+        pos = start + len(b"".join(parts))
+        tail_entries = []
+        for lead in self.leads[first:]:
+            n = loaded_at.get(id(lead))
+            if n is not None and lead == self._snapshot[n]:
+                offset, length, email, domain = entries[n]
+                data = self.index._map[offset:offset + length]
+            else:
+                data = json.dumps(lead, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                email, domain = INDEXED_COLUMNS["email"](lead), INDEXED_COLUMNS["domain"](lead)
+            tail_entries.append([pos, len(data), email, domain])
+            parts += [data, b"\n"]
+            pos += len(data) + 1
+        # a new file swapped in whole, like write_leads(): patching the old one in place
+        # would leave it torn if the run died between the write and the truncate
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            for at in range(0, start, READ_CHUNK):
+                f.write(self.index._map[at:min(at + READ_CHUNK, start)])
+            f.write(b"".join(parts))
+            f.flush()
+            os.fsync(f.fileno())
+        self.index.close()
+        os.replace(tmp_path, self.path)
+        self.index.replace_tail(first, tail_entries)
+        return len(tail_entries)
+
+if __name__ == "__main__":
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ("", [])
+    if command == "pretty" and len(args) <= 2:
+        export_pretty(*args)
+    elif command == "compact" and len(args) <= 2:
+        path = args[0] if args else LEADS_FILE
+        compression = args[1] if len(args) > 1 else None
+        before = os.path.getsize(path)
+        count = write_leads(path, iter_leads(path), compression)
+        print(f"[Leads] Rewrote {count} record(s) in {path} "
+              f"({detect_compression(path)}): {before:,} -> {os.path.getsize(path):,} bytes.")
+    elif command == "import" and len(args) <= 2:
+        path = args[0] if args else LEADS_FILE
+        db_path = args[1] if len(args) > 1 else LEADS_DB
+        if not db_path:
+            sys.exit("[Leads] No database: pass its path or set LEADS_DB.")
+        db = LeadDB(db_path, create=True)
+        print(f"[Leads] Imported {db.import_ndjson(path)} record(s) from {path} into {db_path}.")
+    elif command == "export" and len(args) <= 2:
+        db_path = args[0] if args else LEADS_DB
+        path = args[1] if len(args) > 1 else LEADS_FILE
+        if not db_path:
+            sys.exit("[Leads] No database: pass its path or set LEADS_DB.")
+        print(f"[Leads] Exported {LeadDB(db_path).export_ndjson(path)} record(s) from {db_path} to {path}.")
+    elif command == "get" and 1 <= len(args) <= 2:
+        path, key = args if len(args) == 2 else (LEADS_FILE, args[0])
+        with LeadIndex(path) as index:
+            if key.startswith("#") and key[1:].isdigit():
+                numbers = [int(key[1:]) - 1] if 0 < int(key[1:]) <= len(index) else []
+            elif "@" in key:
+                numbers = [n for n in [index.find_key(key)] if n is not None] if "#" in key else index.find_email(key)
+            else:
+                numbers = index.find_domain(key)
+            for n in numbers:
+                print(f"#{n + 1}: " + json.dumps(index.read(n), ensure_ascii=False, indent=2))
+        if not numbers:
+            sys.exit(f"[Leads] No lead matches {key!r} in {path}.")
+    else:
+        print("usage: lead_store.py pretty [path] [out] | compact [path] [gzip|lzma|none] | "
+              "import [path] [db] | export [db] [path] | get [path] KEY")
+        sys.exit(2)
@@ -1,7 +1,8 @@
 import os
-import json
 from urllib.parse import urlparse
 
+from lead_store import iter_leads, lead_db
+
 INPUT_PATH = "leads/scraped_leads.ndjson"
 PERMS_PATH = "leads/permutations.txt"
 EMAILS_PATH = "leads/emails.txt"
@@ -39,23 +40,10 @@ def load_domains_from_perms_and_emails(*paths):
                     domains.add(domain)
     return domains
 
-def load_multiline_ndjson(path):
-    with open(path, "r", encoding="utf-8") as f:
-        buffer = ""
-        for line in f:
-            if line.strip() == "":
-                continue
-            buffer += line
-            if line.strip().endswith("}"):
-                try:
-                    yield json.loads(buffer)
-                except Exception as e:
-                    print(f"❌ Skipping invalid JSON block: {e}")
-                buffer = ""
-
 def main():
     print("📥 Loading scraped leads...")
-    if not os.path.exists(INPUT_PATH):
+    db = lead_db()
+    if not db and not os.path.exists(INPUT_PATH):
         print(f"❌ Input file not found: {INPUT_PATH}")
         return
 
@@ -69,10 +57,14 @@ def main():
     total_processed = 0
     new_generated = 0
 
-    for record in load_multiline_ndjson(INPUT_PATH):
-        if not isinstance(record, dict):
-            continue
+    if db:
+        # leads that already have an email are only counted
+        skipped_with_email = total_processed = db.count("email != ''")
+        records = [record for _, record in db.select("email = ''")]
+    else:
+        records = iter_leads(INPUT_PATH)
 
+    for record in records:
         total_processed += 1
 
         company = record.get("company name", "Unknown Company").strip()
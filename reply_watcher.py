@@ -0,0 +1,178 @@
+"""
+Long-running reply / bounce watcher for a sending account.
+
+Holds IMAP IDLE on each folder in sender.IMAP_FOLDERS that exists (one connection per
+folder) and, whenever the server reports new mail, runs the same incremental scan
+sender.py does at startup (detect_reply_status over the UID watermarks in the IMAP state
+file), journaling every changed reply flag straight away. Sender runs on the same machine
+pick those flags up from the journal, including mid-batch before each send. The watcher
+only writes the local journal and never commits it, so workflow runs, which start from a
+fresh checkout, don't see its flags and must keep their own bulk scan (IMAP_BULK_SCAN=1,
+the default); IMAP_BULK_SCAN=0 is only safe for a sender sharing the watcher's journal file.
+
+Uses the sender's account and IMAP settings; with a SENDER_ACCOUNTS pool it starts one
+watcher per account. Configuration (environment):
+    WATCH_IDLE_MINUTES    re-issue IDLE this often, default 25 (servers drop idlers at ~30)
+    WATCH_SETTLE_SECONDS  wait after a notification so a burst of arrivals is one scan, default 2
+    WATCH_POLL_SECONDS    NOOP poll interval for servers without IDLE, default 60
+"""
+import os
+import re
+import signal
+import socket
+import imaplib
+import threading
+
+import sender
+from send_journal import lead_keys
+
+WATCH_IDLE_MINUTES = float(os.environ.get("WATCH_IDLE_MINUTES", "25"))
+WATCH_SETTLE_SECONDS = float(os.environ.get("WATCH_SETTLE_SECONDS", "2"))
+WATCH_POLL_SECONDS = float(os.environ.get("WATCH_POLL_SECONDS", "60"))
+EXISTS_RE = re.compile(rb"^\* \d+ EXISTS")
+
+class FolderIdler(threading.Thread):
+    """
+    Keeps IDLE running on one folder on its own connection and sets `wake` whenever the
+    server announces new mail. IDLE is ended and re-issued every WATCH_IDLE_MINUTES; a
+    connection that doesn't answer DONE within a minute is torn down and reopened.
+    """
+
+    def __init__(self, folder, wake, stop):
+        super().__init__(name=f"idle-{folder}", daemon=True)
+        self.folder = folder
+        self.wake = wake
+        self.stop = stop
+        self.mail = None
+        self.lock = threading.Lock()
+        self.idling = False
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                self.mail = sender._open_imap()
+                status, _ = self.mail.select(self.folder, readonly=True)
+                if status != "OK":
+                    return  # folder doesn't exist on this server
+                print(f"[Watch] {self.folder}: watching.")
+                if "IDLE" in self.mail.capabilities:
+                    while not self.stop.is_set():
+                        self._idle()
+                else:
+                    while not self.stop.wait(WATCH_POLL_SECONDS):
+                        self.mail.noop()
+                        if self.mail.untagged_responses.pop("EXISTS", None):
+                            self.wake.set()
+            except Exception as e:
+                if self.stop.is_set():
+                    break
+                print(f"[Watch] {self.folder}: {e}; reconnecting in 30s.")
+                self.stop.wait(30)
+            finally:
+                self._close()
+
+    def _idle(self):
+        mail = self.mail
+        tag = mail._new_tag()
+        mail.send(tag + b" IDLE\r\n")
+        line = mail.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"IDLE refused: {line!r}")
+        with self.lock:
+            self.idling = True
+        renew = threading.Timer(WATCH_IDLE_MINUTES * 60, self.end_idle)
+        renew.start()
+        try:
+            while True:
+                line = mail.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connection closed")
+                if line.startswith(tag + b" "):
+                    break
+                if EXISTS_RE.match(line):
+                    self.wake.set()
+        finally:
+            renew.cancel()
+            with self.lock:
+                self.idling = False
+            mail.tagged_commands.pop(tag, None)
+
+    def end_idle(self):
+        """Send DONE from another thread; the reading thread then sees the tagged reply."""
+        with self.lock:
+            if not self.idling or self.mail is None:
+                return
+            mail = self.mail
+            self.idling = False
+        try:
+            mail.send(b"DONE\r\n")
+        except OSError:
+            pass
+        watchdog = threading.Timer(60, self._kill, args=(mail,))
+        watchdog.daemon = True
+        watchdog.start()
+
+    def _kill(self, mail):
+        if mail is self.mail:
+            try:
+                mail.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _close(self):
+        mail, self.mail = self.mail, None
+        if mail is not None:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+
+def scan_once():
+    """Reload the leads (the sender may have sent since) and apply newly arrived mail. Returns flags changed."""
+    leads, _ = sender.load_leads(verbose=False)
+    lead_key = {id(lead): key for key, lead in lead_keys(leads)}
+    account_leads = sender.select_account_leads(leads, lead_key, verbose=False)
+    return sender.refresh_reply_status(account_leads, lead_key, new_only=True)
+
+def watch():
+    wake, stop = threading.Event(), threading.Event()
+
+    def shutdown(*_):
+        stop.set()
+        wake.set()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    idlers = [FolderIdler(folder, wake, stop) for folder in sender.IMAP_FOLDERS]
+    for idler in idlers:
+        idler.start()
+
+    wake.set()  # catch up on anything that arrived while nobody was watching
+    try:
+        while not stop.is_set():
+            # the periodic scan also covers folders whose idler is reconnecting
+            wake.wait(WATCH_IDLE_MINUTES * 60)
+            if stop.wait(WATCH_SETTLE_SECONDS):
+                break
+            wake.clear()
+            try:
+                changed = scan_once()
+            except Exception as e:
+                print(f"[Watch] Scan failed: {e}")
+                sender.imap_logout()
+                continue
+            if changed:
+                print(f"[Watch] Journaled {changed} reply flag(s).")
+    except KeyboardInterrupt:
+        shutdown()
+    finally:
+        for idler in idlers:
+            idler.end_idle()
+        for idler in idlers:
+            idler.join(timeout=5)
+        sender.imap_logout()
+    print("[Watch] Stopped.")
+
+if __name__ == "__main__":
+    if len(sender.ACCOUNTS) > 1 and not sender.SENDER_ACCOUNT:
+        exit(sender.run_account_workers(sender.ACCOUNTS, script=os.path.abspath(__file__)))
+    watch()
@@ -4,6 +4,7 @@ import fs from 'fs';
 import fsPromises from 'fs/promises';
 import fsExtra from 'fs-extra';
 import path from 'path';
+import zlib from 'zlib';
 
 puppeteer.use(StealthPlugin());
 
@@ -58,11 +59,20 @@ const nameSuffixes = [
 ];
 
 const allLeads = new Map();
+// Same layout as lead_store.py: one compact record per line, gzip-compressed if the file already was
+let leadsGzip = false;
 
 async function loadExistingLeads() {
   if (!fs.existsSync(leadsPath)) return;
-  const content = await fsPromises.readFile(leadsPath, 'utf-8');
-  const blocks = content.split(/\n\s*\n/);
+  let raw = await fsPromises.readFile(leadsPath);
+  if (raw[0] === 0x1f && raw[1] === 0x8b) {
+    leadsGzip = true;
+    raw = zlib.gunzipSync(raw);
+  } else if (raw[0] === 0xfd && raw.subarray(1, 6).toString('latin1') === '7zXZ\0') {
+    throw new Error(`${leadsPath} is lzma-compressed; convert it with "python lead_store.py compact ${leadsPath} gzip"`);
+  }
+  // every record (compact or indent=2) starts with "{" at the start of a line
+  const blocks = raw.toString('utf-8').split(/\n(?=\{)/);
   for (const block of blocks) {
     if (!block.trim()) continue;
     try {
@@ -188,8 +198,10 @@ function storeNewLead(record) {
 
 async function saveAllLeads() {
   const records = Array.from(allLeads.values());
-  const ndjson = records.map(obj => JSON.stringify(obj, null, 2)).join('\n\n') + '\n';
-  await fsPromises.writeFile(leadsPath, ndjson, 'utf-8');
+  const ndjson = records.map(obj => JSON.stringify(obj) + '\n').join('');
+  const tmpPath = leadsPath + '.tmp';
+  await fsPromises.writeFile(tmpPath, leadsGzip ? zlib.gzipSync(ndjson) : ndjson);
+  await fsPromises.rename(tmpPath, leadsPath);
   console.log(`💾 Saved ${records.length} total leads to ${leadsPath}`);
 }
 
@@ -0,0 +1,169 @@
+import json
+import os
+from collections import Counter
+
+from lead_store import LEADS_FILE, LeadFile, lead_db
+
+JOURNAL_FILE = "leads/send_journal.ndjson"
+
+# step -> (date field, time field) stamped on the lead when that email goes out
+SENT_FIELDS = {
+    "initial": ("initial date", "initial time"),
+    "fu1": ("follow-up 1 date", "follow-up 1 time"),
+    "fu2": ("follow-up 2 date", "follow-up 2 time"),
+}
+
+def lead_keys(leads):
+    """
+    Stable key per lead: lowercased email, with '#n' on repeats in file order. Repeats are
+    counted by position, so a script that drops, reorders or re-emails leads must fold the
+    journal in with compact() before it changes the file, or replay would put those
+    events on the wrong lead.
+    """
+    seen = Counter()
+    for lead in leads:
+        email = str(lead.get("email", "")).strip().lower()
+        if not email:
+            continue
+        seen[email] += 1
+        yield (email if seen[email] == 1 else f"{email}#{seen[email]}"), lead
+
+# === Events ===
+def sent_event(key, step, subject, sent_at, account=None):
+    event = {"event": "sent", "key": key, "step": step, "subject": subject,
+             "date": sent_at.date().isoformat(), "time": sent_at.strftime("%H:%M")}
+    if account:
+        event["account"] = account
+    return event
+
+def reply_event(key, reply):
+    return {"event": "reply", "key": key, "reply": reply}
+
+def apply_event(lead, event):
+    if event["event"] == "sent":
+        date_field, time_field = SENT_FIELDS[event["step"]]
+        lead[date_field] = event["date"]
+        lead[time_field] = event["time"]
+        if event["step"] == "initial":
+            lead["subject"] = event["subject"]
+        if event.get("account"):
+            # follow-ups go out from the account that sent the initial
+            lead["sender account"] = event["account"]
+    elif event["event"] == "reply":
+        lead["reply"] = event["reply"]
+
+def append_events(events, path=JOURNAL_FILE):
+    """
+    Append events as one compact JSON object per line, in a single write so that
+    parallel account workers appending to the same journal never interleave lines.
+    Returns the number written.
+    """
+    if not events:
+        return 0
+    lines = "".join(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n" for event in events)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+    return len(events)
+
+def read_events(path=JOURNAL_FILE):
+    events = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # a run killed mid-append can leave a partial last line
+                    print(f"[Journal] Skipping unreadable line {number} in {path}")
+    except FileNotFoundError:
+        pass
+    return events
+
+def read_events_since(offset, path=JOURNAL_FILE):
+    """
+    Events appended at or after byte `offset`, up to the last complete line.
+    Returns (events, offset to continue from), for following a journal other processes append to.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], offset
+    end = data.rfind(b"\n") + 1
+    events = []
+    for line in data[:end].splitlines():
+        try:
+            events.append(json.loads(line))
+        except ValueError:
+            pass
+    return events, offset + end
+
+def replay(leads, events):
+    """Apply events over the leads in journal order. Returns the events whose lead no longer exists."""
+    by_key = dict(lead_keys(leads))
+    unmatched = []
+    for event in events:
+        lead = by_key.get(event.get("key"))
+        if lead is None:
+            unmatched.append(event)
+            continue
+        apply_event(lead, event)
+    return unmatched
+
+def replay_db(db, events):
+    """
+    replay() into a LeadDB: each lead an event names is found through the email index
+    and rewritten once, in one transaction. Returns the events whose lead no longer exists.
+    """
+    touched, unmatched = {}, []
+    for event in events:
+        key = event.get("key") or ""
+        if key not in touched:
+            email, sep, n = key.rpartition("#")
+            if not (sep and n.isdigit()):
+                email, n = key, "1"
+            rows = db.select("email = ?", (email,)) if email else []
+            touched[key] = rows[int(n) - 1] if 0 < int(n) <= len(rows) else None
+        if touched[key] is None:
+            unmatched.append(event)
+            continue
+        apply_event(touched[key][1], event)
+    with db:
+        for lead_id, lead in filter(None, touched.values()):
+            db.update(lead_id, lead)
+    return unmatched
+
+def compact(leads_file=LEADS_FILE, path=JOURNAL_FILE, db=None):
+    """
+    Fold the journal into the leads file, or into `db` (a LeadDB), and truncate it,
+    keeping events that matched no lead.
+    """
+    events = read_events(path)
+    if not events:
+        print("[Journal] Nothing to compact.")
+        return
+    if db:
+        unmatched = replay_db(db, events)
+        leads_file = db.path
+    else:
+        store = LeadFile(leads_file)
+        unmatched = replay(store.leads, events)
+        store.save()
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for event in unmatched:
+            f.write(json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n")
+    os.replace(tmp_path, path)
+
+    print(f"[Journal] Folded {len(events) - len(unmatched)} event(s) into {leads_file}.")
+    if unmatched:
+        print(f"[Journal] Kept {len(unmatched)} event(s) with no matching lead in {path}.")
+
+if __name__ == "__main__":
+    compact(db=lead_db())
@@ -4,33 +4,230 @@ import smtplib
 import imaplib
 import email
 from email.header import decode_header
+from email.parser import BytesFeedParser
 from email.utils import parsedate_to_datetime
 import re
+import sys
+import math
 import random
+import hashlib
+import heapq
+import binascii
+import quopri
+import copy
+import asyncio
+import threading
+import subprocess
+import atexit
+from contextlib import contextmanager
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from email.message import EmailMessage
 from datetime import datetime, timedelta, time
+from time import perf_counter, sleep
 from zoneinfo import ZoneInfo
 
+from lead_store import LEADS_FILE, lead_db, read_leads
+from send_journal import (JOURNAL_FILE, append_events, apply_event, lead_keys, read_events, read_events_since,
+                          reply_event, replay, sent_event)
+
 # === Config ===
-EMAIL_ADDRESS = os.environ["EMAIL_ADDRESS"]
-EMAIL_PASSWORD = os.environ["EMAIL_PASSWORD"]
-FROM_EMAIL = os.environ.get("FROM_EMAIL", EMAIL_ADDRESS)
-SMTP_SERVER = "smtppro.zoho.com"
-SMTP_PORT = 465
-IMAP_SERVER = "imappro.zoho.com"
-LEADS_FILE = "leads/scraped_leads.ndjson"
+# Server settings are the defaults for every account in the pool (see "Account pool")
+SMTP_SERVER = os.environ.get("SMTP_SERVER") or "smtppro.zoho.com"
+SMTP_PORT = int(os.environ.get("SMTP_PORT") or 465)
+SMTP_SSL = os.environ.get("SMTP_SSL", "1") != "0"
+IMAP_SERVER = os.environ.get("IMAP_SERVER") or "imappro.zoho.com"
+IMAP_PORT = int(os.environ.get("IMAP_PORT") or 993)
+IMAP_SSL = os.environ.get("IMAP_SSL", "1") != "0"
+IMAP_LOOKBACK_DAYS = 30
+# 0 skips the bulk reply scan at startup; only for a sender sharing its journal file with a
+# running reply_watcher.py (that watcher never commits, so workflow runs keep the scan)
+IMAP_BULK_SCAN = os.environ.get("IMAP_BULK_SCAN", "1") != "0"
 TIMEZONE = ZoneInfo("Africa/Lagos")
-NOW = datetime.now(TIMEZONE)
-TODAY = NOW.date()
-NOW_TIME = NOW.strftime("%H:%M")
-WEEKDAY = TODAY.weekday()
-BASE_START_TIME = time(14, 0)
-END_TIME = time(20, 0)
-FINAL_END_TIME = time(20, 0)
-
-if WEEKDAY >= 5:
-    print("[Skipped] Weekend detected — exiting.")
-    exit(0)
+# SENDER_NOW (ISO datetime, Lagos time when naive) pins the clock for simulations;
+# pacing then advances it instead of sleeping
+SENDER_NOW = os.environ.get("SENDER_NOW", "").strip()
+_virtual_now = None
+if SENDER_NOW:
+    _virtual_now = datetime.fromisoformat(SENDER_NOW)
+    if _virtual_now.tzinfo is None:
+        _virtual_now = _virtual_now.replace(tzinfo=TIMEZONE)
+
+def now():
+    return _virtual_now if _virtual_now is not None else datetime.now(TIMEZONE)
+
+def pause(seconds):
+    global _virtual_now
+    if _virtual_now is not None:
+        _virtual_now += timedelta(seconds=seconds)
+    else:
+        sleep(seconds)
+
+DEFAULT_QUOTA = 70
+DEFAULT_START_TIME = time(14, 0)
+DEFAULT_END_TIME = time(20, 0)
+# "single" sends one email per run; "batch" sends the day's queue with in-process pacing
+SEND_MODE = os.environ.get("SEND_MODE", "single").strip().lower()
+# Token-bucket pacing (see "Send pacing") for batch mode: per account, and per account and
+# recipient domain. A rate of 0 means no limit. The defaults keep the old pace of one send every 7 minutes
+# with no per-domain limit.
+SEND_RATE_PER_HOUR = float(os.environ.get("SEND_RATE_PER_HOUR") or 60 / 7)
+SEND_BURST = float(os.environ.get("SEND_BURST", "1"))
+DOMAIN_RATE_PER_HOUR = float(os.environ.get("DOMAIN_RATE_PER_HOUR", "0"))
+DOMAIN_BURST = float(os.environ.get("DOMAIN_BURST", "1"))
+# single mode keeps the fixed schedule: the window opens this many minutes per quota slot
+# before the start time, and each dispatch sends straight away
+SEND_INTERVAL_MINUTES = 7
+SEND_JITTER_SECONDS = float(os.environ.get("SEND_JITTER_SECONDS", "30"))  # random extra wait before a paced send
+SEND_MAX_RUN_MINUTES = float(os.environ.get("SEND_MAX_RUN_MINUTES", "0"))  # 0 = until the window closes
+SEND_PREFETCH = max(0, int(os.environ.get("SEND_PREFETCH", "3")))  # queued leads whose reply check runs ahead
+METRICS_FILE = os.environ.get("SENDER_METRICS_FILE", "sender_metrics.json")
+
+# === Account pool ===
+# SENDER_ACCOUNTS is a JSON list of sending mailboxes, or the path of a file holding one:
+#   [{"name": "main", "email": "...", "password": "...", "from": "...",
+#     "daily_quota": 70, "start": "14:00", "end": "20:00", "rate_per_hour": 20, "burst": 2,
+#     "smtp_server": "...", ...}]
+# Only "email" and "password" are required; servers default to the SMTP_* / IMAP_*
+# settings above. Without it, EMAIL_ADDRESS / EMAIL_PASSWORD / FROM_EMAIL are the one account.
+# With several accounts this process only starts one worker per account (SENDER_ACCOUNT=name).
+ACCOUNT_NAME_RE = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+def _clock_time(value, default):
+    return datetime.strptime(value, "%H:%M").time() if value else default
+
+def load_accounts():
+    raw = os.environ.get("SENDER_ACCOUNTS", "").strip()
+    if not raw:
+        # blank when unset, so the module can be imported (and plan() run) without credentials
+        entries = [{"name": "default", "email": os.environ.get("EMAIL_ADDRESS", ""),
+                    "password": os.environ.get("EMAIL_PASSWORD", ""), "from": os.environ.get("FROM_EMAIL")}]
+    elif raw.startswith("["):
+        entries = json.loads(raw)
+    else:
+        with open(raw, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+
+    accounts = []
+    for entry in entries:
+        account = {
+            "name": str(entry.get("name") or entry["email"].split("@")[0]).strip(),
+            "email": entry["email"],
+            "password": entry["password"],
+            "from": entry.get("from") or entry["email"],
+            "smtp_server": entry.get("smtp_server") or SMTP_SERVER,
+            "smtp_port": int(entry.get("smtp_port") or SMTP_PORT),
+            "smtp_ssl": bool(entry.get("smtp_ssl", SMTP_SSL)),
+            "imap_server": entry.get("imap_server") or IMAP_SERVER,
+            "imap_port": int(entry.get("imap_port") or IMAP_PORT),
+            "imap_ssl": bool(entry.get("imap_ssl", IMAP_SSL)),
+            "daily_quota": max(0, int(entry.get("daily_quota", DEFAULT_QUOTA))),
+            "start": _clock_time(entry.get("start"), DEFAULT_START_TIME),
+            "end": _clock_time(entry.get("end"), DEFAULT_END_TIME),
+            "rate_per_hour": float(entry.get("rate_per_hour", SEND_RATE_PER_HOUR)),
+            "burst": float(entry.get("burst", SEND_BURST)),
+        }
+        if not ACCOUNT_NAME_RE.match(account["name"]):
+            raise ValueError(f"Account name {account['name']!r} may only use letters, digits, '.', '_' and '-'")
+        if any(a["name"] == account["name"] for a in accounts):
+            raise ValueError(f"Duplicate account name {account['name']!r} in SENDER_ACCOUNTS")
+        accounts.append(account)
+    if not accounts:
+        raise ValueError("SENDER_ACCOUNTS lists no accounts")
+    return accounts
+
+def run_account_workers(accounts, script=None, args=()):
+    """
+    Run one process of `script` (default: this sender) per account in parallel with `args`,
+    relaying each one's output prefixed with the account name, then gather their metrics files into
+    METRICS_FILE. Returns the first non-zero worker exit code, else 0.
+    """
+    started = perf_counter()
+    root, ext = os.path.splitext(METRICS_FILE)
+    workers = {}
+    for account in accounts:
+        metrics_path = f"{root}.{account['name']}{ext}"
+        env = dict(os.environ, SENDER_ACCOUNT=account["name"], SENDER_METRICS_FILE=metrics_path,
+                   PYTHONUNBUFFERED="1", PYTHONIOENCODING="utf-8")
+        proc = subprocess.Popen([sys.executable, script or os.path.abspath(__file__), *args], env=env, text=True, encoding="utf-8",
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        workers[account["name"]] = (proc, metrics_path)
+    print(f"[Accounts] Started {len(workers)} worker(s): {', '.join(workers)}")
+
+    def relay(name, proc):
+        for line in proc.stdout:
+            print(f"[{name}] {line}", end="", flush=True)
+
+    relays = [threading.Thread(target=relay, args=(name, proc)) for name, (proc, _) in workers.items()]
+    for t in relays:
+        t.start()
+    for t in relays:
+        t.join()
+
+    codes = {}
+    report = {"accounts": {}}
+    for name, (proc, metrics_path) in workers.items():
+        codes[name] = proc.wait()
+        try:
+            with open(metrics_path, "r", encoding="utf-8") as f:
+                report["accounts"][name] = json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+    report["wall_seconds"] = round(perf_counter() - started, 4)
+    if report["accounts"]:  # dry runs (`plan`) write none
+        try:
+            with open(METRICS_FILE, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        except Exception as e:
+            print(f"[Metrics] Could not write {METRICS_FILE}: {e}")
+    print(f"[Accounts] Worker exit codes: {codes}")
+    return next((code for code in codes.values() if code), 0)
+
+ACCOUNT_POOL = bool(os.environ.get("SENDER_ACCOUNTS", "").strip())
+ACCOUNTS = load_accounts()
+SENDER_ACCOUNT = os.environ.get("SENDER_ACCOUNT", "").strip()
+ACCOUNT = next((a for a in ACCOUNTS if a["name"] == SENDER_ACCOUNT), None) if SENDER_ACCOUNT else ACCOUNTS[0]
+if ACCOUNT is None:
+    raise ValueError(f"[Accounts] SENDER_ACCOUNT={SENDER_ACCOUNT!r} is not in SENDER_ACCOUNTS.")
+ACCOUNT_NAME = ACCOUNT["name"]
+
+def account_path(path):
+    """This account's copy of a per-mailbox state file; without a pool the plain path is kept."""
+    if not ACCOUNT_POOL:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{ACCOUNT_NAME}{ext}"
+
+def _rendezvous_score(email_key, account):
+    digest = hashlib.sha1(f"{account['name']}\n{email_key}".encode("utf-8")).digest()
+    u = (int.from_bytes(digest[:8], "big") + 0.5) / 2 ** 64
+    return -account["daily_quota"] / math.log(u)
+
+def lead_account(lead):
+    """
+    Name of the account that sends to this lead. Sticky: the account recorded by its sends
+    wins, and leads first sent before the pool existed stay with the first account. Unsent
+    leads get a quota-weighted rendezvous-hash pick on their email, which every worker
+    computes alike without coordinating; changing the pool only moves unsent leads.
+    """
+    name = str(lead.get("sender account", "")).strip()
+    if name:
+        return name
+    if str(lead.get("initial date", "")).strip():
+        return ACCOUNTS[0]["name"]
+    email_key = str(lead.get("email", "")).strip().lower()
+    return max(ACCOUNTS, key=lambda account: _rendezvous_score(email_key, account))["name"]
+
+# This process sends as ACCOUNT; everything below uses its settings
+EMAIL_ADDRESS = ACCOUNT["email"]
+EMAIL_PASSWORD = ACCOUNT["password"]
+FROM_EMAIL = ACCOUNT["from"]
+SMTP_SERVER, SMTP_PORT, SMTP_SSL = ACCOUNT["smtp_server"], ACCOUNT["smtp_port"], ACCOUNT["smtp_ssl"]
+IMAP_SERVER, IMAP_PORT, IMAP_SSL = ACCOUNT["imap_server"], ACCOUNT["imap_port"], ACCOUNT["imap_ssl"]
+BASE_QUOTA = ACCOUNT["daily_quota"]
+BASE_START_TIME = ACCOUNT["start"]
+END_TIME = ACCOUNT["end"]
+IMAP_STATE_FILE = account_path("leads/imap_state.json")
 
 # === Subject Pool ===
 initial_subjects = [
@@ -51,29 +248,8 @@ initial_subjects = [
     "Bit of an odd angle, but may click", "Does this feel off-brand or on-point?",
     "Just playing with this angle",
 ]
-random.shuffle(initial_subjects)
-
-# === Helpers for NDJSON ===
-def read_multiline_ndjson(path):
-    records, buffer = [], ""
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                continue
-            buffer += line
-            if line.strip().endswith("}"):
-                try:
-                    records.append(json.loads(buffer))
-                except:
-                    pass
-                buffer = ""
-    return records
-
-def write_multiline_ndjson(path, records):
-    with open(path, "w", encoding="utf-8") as f:
-        for r in records:
-            f.write(json.dumps(r, ensure_ascii=False, indent=2) + "\n")
 
+# === Lead helpers ===
 def is_ascii_email(email_addr):
     try:
         email_addr.encode('ascii')
@@ -91,6 +267,123 @@ def next_subject(pool, **kwargs):
     pool.append(template)
     return template.format(**kwargs)
 
+# === Run metrics ===
+class RunMetrics:
+    """
+    Wall time, call counts and byte counters per named phase ("reply_scan.INBOX.fetch",
+    "smtp.send", ...). Thread-safe so the parallel folder scan can record into it.
+    A sender run writes it as JSON when the process exits, including early exits.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.started_at = now()
+        self.phases = {}
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds=0.0, calls=1, **counters):
+        with self.lock:
+            phase = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+            phase["seconds"] += seconds
+            phase["calls"] += calls
+            for key, value in counters.items():
+                phase[key] = phase.get(key, 0) + value
+
+    @contextmanager
+    def timed(self, name, conn=None):
+        """Time a block; with conn, also record the bytes it moved over that connection."""
+        down, up = _conn_bytes(conn)
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - t0
+            if conn is None:
+                self.add(name, seconds)
+            else:
+                down2, up2 = _conn_bytes(conn)
+                self.add(name, seconds, bytes_down=down2 - down, bytes_up=up2 - up)
+
+    def write(self, path):
+        report = {
+            "started_at": self.started_at.isoformat(),
+            "send_mode": SEND_MODE,
+            "wall_seconds": round(perf_counter() - self.started, 4),
+            "counts": self.counts,
+            "phases": {name: {k: round(v, 4) if isinstance(v, float) else v for k, v in phase.items()}
+                       for name, phase in sorted(self.phases.items())},
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+metrics = RunMetrics()
+
+def _write_metrics():
+    try:
+        metrics.write(METRICS_FILE)
+    except Exception as e:
+        print(f"[Metrics] Could not write {METRICS_FILE}: {e}")
+
+def _conn_bytes(conn):
+    return getattr(conn, "bytes_down", 0), getattr(conn, "bytes_up", 0)
+
+class _CountingIMAP:
+    """imaplib mixin counting the bytes read from and written to the server."""
+    bytes_down = bytes_up = 0
+
+    def read(self, size):
+        data = super().read(size)
+        self.bytes_down += len(data)
+        return data
+
+    def readline(self):
+        line = super().readline()
+        self.bytes_down += len(line)
+        return line
+
+    def send(self, data):
+        self.bytes_up += len(data)
+        super().send(data)
+
+class CountingIMAP4(_CountingIMAP, imaplib.IMAP4):
+    pass
+
+class CountingIMAP4_SSL(_CountingIMAP, imaplib.IMAP4_SSL):
+    pass
+
+class _CountingReader:
+    def __init__(self, raw, conn):
+        self.raw = raw
+        self.conn = conn
+
+    def readline(self, size=-1):
+        line = self.raw.readline(size)
+        self.conn.bytes_down += len(line)
+        return line
+
+    def close(self):
+        self.raw.close()
+
+class _CountingSMTP:
+    """smtplib mixin counting the bytes read from and written to the server."""
+    bytes_down = bytes_up = 0
+
+    def send(self, s):
+        self.bytes_up += len(s)
+        super().send(s)
+
+    def getreply(self):
+        if self.file is None and self.sock is not None:
+            self.file = _CountingReader(self.sock.makefile("rb"), self)
+        return super().getreply()
+
+class CountingSMTP(_CountingSMTP, smtplib.SMTP):
+    pass
+
+class CountingSMTP_SSL(_CountingSMTP, smtplib.SMTP_SSL):
+    pass
+
 # === IMAP scanning utilities ===
 IMAP_FOLDERS = ["INBOX", "[Gmail]/Spam", "SPAM", "Spam", "Junk"]
 
@@ -109,35 +402,6 @@ def _safe_decode_header(value):
             out += part
     return out
 
-def _extract_body_text(msg):
-    body = ""
-    try:
-        if msg.is_multipart():
-            for part in msg.walk():
-                ctype = part.get_content_type()
-                disp = str(part.get("Content-Disposition", ""))
-                if ctype == "text/plain" and "attachment" not in disp:
-                    try:
-                        body += part.get_payload(decode=True).decode(part.get_content_charset() or "utf-8", errors="ignore")
-                    except:
-                        body += part.get_payload(decode=True).decode(errors="ignore")
-        else:
-            try:
-                body += msg.get_payload(decode=True).decode(msg.get_content_charset() or "utf-8", errors="ignore")
-            except:
-                body += msg.get_payload(decode=True).decode(errors="ignore")
-    except Exception:
-        # last resort: try raw payload decode
-        try:
-            raw = msg.as_bytes()
-            body += raw.decode(errors="ignore")
-        except:
-            pass
-    # If only HTML present, strip tags lightly
-    if "<html" in body.lower() and not re.search(r"\w{3,}", body):
-        body = re.sub(r"<[^>]+>", "", body)
-    return body
-
 def _parse_msg_datetime(msg):
     date_hdr = msg.get("Date")
     if not date_hdr:
@@ -150,219 +414,853 @@ def _parse_msg_datetime(msg):
     except Exception:
         return None
 
-def detect_reply_status(leads):
+# Address-like tokens; matched case-insensitively and normalized to lowercase. A match may
+# only start where a run of local-part characters does, so long runs without an "@" (base64,
+# filler) are scanned once rather than retried from every position.
+EMAIL_TOKEN_RE = re.compile(r"(?<![a-z0-9._%+-])[a-z0-9._%+-]+@[a-z0-9-]+(?:\.[a-z0-9-]+)+", re.IGNORECASE)
+BOUNCE_SUBJECT_RE = re.compile(
+    r"undeliver|delivery failure|delivery status notification|failure notice|returned mail|delivery failed",
+    re.IGNORECASE,
+)
+
+def _extract_addresses(text):
+    if not text:
+        return set()
+    return {m.group(0).strip(".-").lower() for m in EMAIL_TOKEN_RE.finditer(text)}
+
+# === Bounce parsing ===
+DSN_REPORT_TYPES = {"message/delivery-status", "message/global-delivery-status"}
+DSN_FIELD_RE = re.compile(r"^([A-Za-z-]+)[ \t]*:[ \t]*(.*)$", re.MULTILINE)
+DSN_FOLD_RE = re.compile(r"\r?\n[ \t]+")
+DSN_BLOCK_RE = re.compile(r"\r?\n[ \t]*\r?\n")
+# Plain-text bounce layouts of common MTAs; each capture holds the failed address(es)
+BOUNCE_TEXT_PATTERNS = [
+    # Postfix / qmail / Yahoo: "<user@host>: host mx said: 550 ..."
+    re.compile(r"^[ \t]*<([^<>\s]+@[^<>\s]+)>:", re.MULTILINE),
+    # Exim: "The following address(es) failed:\n\n  user@host"
+    re.compile(r"following address(?:\(es\)|es)? failed:[ \t]*\r?\n\s*((?:[^\n]*\S[^\n]*\n?)+)", re.IGNORECASE),
+    # Gmail
+    re.compile(r"wasn.t delivered to\s+(\S+@\S+)", re.IGNORECASE),
+    re.compile(r"recipients? failed permanently:\s*(\S+@\S+)", re.IGNORECASE),
+    # Exchange / Outlook
+    re.compile(r"Delivery has failed to these recipients or groups:\s*([^\n]+)", re.IGNORECASE),
+    re.compile(r"Your message to\s+(\S+@\S+)\s+couldn.t be delivered", re.IGNORECASE),
+    # Generic wording
+    re.compile(r"(?:could not|couldn.t|unable to) (?:be )?deliver(?:ed)?(?: your message)? to(?: the following addresse?s?)?[:\s]+<?(\S+@[^\s>]+)", re.IGNORECASE),
+]
+
+def parse_dsn_failed_recipients(text):
+    """Failed recipients listed in a message/delivery-status body (RFC 3464)."""
+    failed = set()
+    for block in DSN_BLOCK_RE.split(text or ""):
+        fields = {}
+        for m in DSN_FIELD_RE.finditer(DSN_FOLD_RE.sub(" ", block)):
+            fields[m.group(1).lower()] = m.group(2).strip()
+        recipient = fields.get("final-recipient") or fields.get("original-recipient")
+        if not recipient:
+            continue
+        action = fields.get("action", "").lower()
+        status = fields.get("status", "")
+        if action == "failed" or status.startswith("5"):
+            failed |= _extract_addresses(recipient.split(";", 1)[-1])
+    return failed
+
+def parse_bounce_recipients(parts):
     """
-    Scans IMAP folders and marks leads with 'reply' if we detect a reply or bounce.
-    It compares message date to each lead's last send time to decide whether the reply occurred after
-    initial / FU1 / FU2.
+    Failed recipients of a bounce, read once per message from its (content_type, text) parts.
+    DSN reports win; otherwise plain-text bodies are matched against BOUNCE_TEXT_PATTERNS.
+    Returns a set (possibly empty, e.g. a delay-only DSN), or None when the bounce
+    layout wasn't recognized.
     """
-    print("[IMAP] Scanning mailbox for replies/bounces...")
-    try:
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-        mail.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-    except Exception as e:
-        print(f"[IMAP] Connection error: {e}")
+    reports = [text for ctype, text in parts if ctype in DSN_REPORT_TYPES]
+    if reports:
+        failed = set()
+        for text in reports:
+            failed |= parse_dsn_failed_recipients(text)
+        return failed
+    failed = set()
+    for ctype, text in parts:
+        if ctype != "text/plain":
+            continue
+        for pattern in BOUNCE_TEXT_PATTERNS:
+            for m in pattern.finditer(text):
+                failed |= _extract_addresses(m.group(1))
+    return failed or None
+
+# === Two-phase fetch (headers + BODYSTRUCTURE first, text parts on demand) ===
+HEADER_FIELDS = "FROM TO SUBJECT DATE REPLY-TO CONTENT-TYPE"
+HEADER_FETCH = f"(BODY.PEEK[HEADER.FIELDS ({HEADER_FIELDS})] BODYSTRUCTURE)"
+IMAP_BODY_BYTE_CAP = int(os.environ.get("IMAP_BODY_BYTE_CAP", "65536"))
+IMAP_FETCH_CHUNK = max(1, int(os.environ.get("IMAP_FETCH_CHUNK", "200")))
+# Concurrent IMAP connections for the bulk folder scan (1 = serial on the shared connection)
+IMAP_SCAN_WORKERS = max(1, int(os.environ.get("IMAP_SCAN_WORKERS", "1")))
+# Parts whose text can name a lead: plain bodies, DSN reports, returned headers
+SCAN_PART_TYPES = {"text/plain", "message/delivery-status", "message/global-delivery-status", "text/rfc822-headers"}
+
+def _imap_tokens(data):
+    """
+    Parse an imaplib response list (bytes lines and (prefix, literal) tuples) into
+    nested lists. Atoms come back as str, quoted strings and literals as bytes, NIL as None.
+    """
+    stack = [[]]
+
+    def tokenize(chunk):
+        pos = 0
+        while pos < len(chunk):
+            c = chunk[pos:pos + 1]
+            if c in b" \r\n":
+                pos += 1
+            elif c == b"(":
+                stack.append([])
+                pos += 1
+            elif c == b")":
+                done = stack.pop()
+                stack[-1].append(done)
+                pos += 1
+            elif c == b'"':
+                out = bytearray()
+                pos += 1
+                while pos < len(chunk) and chunk[pos:pos + 1] != b'"':
+                    if chunk[pos:pos + 1] == b"\\":
+                        pos += 1
+                    out += chunk[pos:pos + 1]
+                    pos += 1
+                pos += 1
+                stack[-1].append(bytes(out))
+            else:
+                start, depth = pos, 0
+                while pos < len(chunk):
+                    ch = chunk[pos:pos + 1]
+                    if ch == b"[":
+                        depth += 1
+                    elif ch == b"]":
+                        depth -= 1
+                    elif depth <= 0 and ch in b" ()":
+                        break
+                    pos += 1
+                atom = chunk[start:pos].decode("ascii", errors="replace")
+                stack[-1].append(None if atom.upper() == "NIL" else atom)
+
+    for item in data or []:
+        if isinstance(item, tuple):
+            prefix, literal = item[0], item[1]
+            tokenize(re.sub(rb"\{\d+\}$", b"", prefix.rstrip()))
+            stack[-1].append(literal)
+        elif isinstance(item, bytes):
+            tokenize(item)
+    while len(stack) > 1:  # tolerate a truncated response
+        done = stack.pop()
+        stack[-1].append(done)
+    return stack[0]
+
+def _parse_fetch_response(data):
+    """Returns a list of dicts (one per FETCH response) mapping upper-cased item names to values."""
+    tokens = _imap_tokens(data)
+    results = []
+    for i in range(len(tokens) - 1):
+        if isinstance(tokens[i], str) and tokens[i].isdigit() and isinstance(tokens[i + 1], list):
+            items = tokens[i + 1]
+            results.append({str(items[j]).upper(): items[j + 1] for j in range(0, len(items) - 1, 2)})
+    return results
+
+def _fetch_item(resp, prefix):
+    """Look up a section item such as BODY[1.2]<0> regardless of the echoed origin."""
+    for key, value in resp.items():
+        if key.split("<")[0] == prefix:
+            return value
+    return None
+
+def _as_text(value):
+    if value is None:
+        return ""
+    return value.decode(errors="ignore") if isinstance(value, bytes) else str(value)
+
+def _structure_parts(node, spec=""):
+    """
+    Walk a parsed BODYSTRUCTURE and yield (section, content_type, params, encoding, size, disposition)
+    for every leaf part, using IMAP part numbering.
+    """
+    if not isinstance(node, list) or not node:
+        return
+    if isinstance(node[0], list):  # multipart: children first, then subtype
+        n = 0
+        for child in node:
+            if not isinstance(child, list):
+                break
+            n += 1
+            yield from _structure_parts(child, f"{spec}.{n}" if spec else str(n))
         return
 
-    # Normalize leads index by email for quick lookup
-    lead_map = {}
-    for lead in leads:
-        email_key = str(lead.get("email", "")).strip().lower()
-        if email_key:
-            lead_map.setdefault(email_key, []).append(lead)
+    section = spec or "1"
+    ctype = f"{_as_text(node[0])}/{_as_text(node[1])}".lower()
+    params = node[2] if len(node) > 2 and isinstance(node[2], list) else []
+    params = {_as_text(params[i]).lower(): _as_text(params[i + 1]) for i in range(0, len(params) - 1, 2)}
+    encoding = _as_text(node[5]).lower() if len(node) > 5 else ""
+    try:
+        size = int(node[6])
+    except (IndexError, TypeError, ValueError):
+        size = 0
+    # extension data sits after the type-specific fields
+    if ctype == "message/rfc822":
+        disp_idx = 11
+    elif ctype.startswith("text/"):
+        disp_idx = 9
+    else:
+        disp_idx = 8
+    disposition = ""
+    if len(node) > disp_idx and isinstance(node[disp_idx], list) and node[disp_idx]:
+        disposition = _as_text(node[disp_idx][0]).lower()
+    yield section, ctype, params, encoding, size, disposition
 
-    # Precompute lead send datetimes (tz-aware) for comparisons
-    def lead_send_dt(lead, date_field, time_field):
-        d = str(lead.get(date_field, "")).strip()
-        t = str(lead.get(time_field, "")).strip()
-        if not d or not t:
-            return None
-        try:
-            return datetime.strptime(f"{d} {t}", "%Y-%m-%d %H:%M").replace(tzinfo=TIMEZONE)
-        except:
-            return None
+    if ctype == "message/rfc822" and len(node) > 8 and isinstance(node[8], list):
+        inner = node[8]
+        yield from _structure_parts(inner, section if inner and isinstance(inner[0], list) else f"{section}.1")
 
-    # Scan folders
-    for folder in IMAP_FOLDERS:
+def _body_sections(structure):
+    """
+    Pick the sections worth downloading to find lead addresses: non-attachment text/plain,
+    DSN reports, returned headers, and the header block of embedded messages.
+    Returns a list of (section, content_type, charset, encoding, size).
+    """
+    sections = []
+    single_part = bool(structure) and not isinstance(structure[0], list)
+    for section, ctype, params, encoding, size, disposition in _structure_parts(structure):
+        if ctype == "message/rfc822":
+            sections.append((f"{section}.HEADER", "text/rfc822-headers", "utf-8", "7bit", 0))
+        elif disposition == "attachment":
+            continue
+        elif ctype in SCAN_PART_TYPES or (single_part and ctype.startswith("text/")):
+            sections.append((section, ctype, params.get("charset") or "utf-8", encoding, size))
+    return sections
+
+def _decode_part(raw, encoding, charset):
+    try:
+        if encoding == "base64":
+            compact = re.sub(rb"[^A-Za-z0-9+/=]", b"", raw)
+            raw = binascii.a2b_base64(compact[: len(compact) - len(compact) % 4])
+        elif encoding == "quoted-printable":
+            raw = quopri.decodestring(raw)
+    except Exception:
+        pass
+    try:
+        return raw.decode(charset or "utf-8", errors="ignore")
+    except LookupError:
+        return raw.decode(errors="ignore")
+
+# Fallback for messages without a usable BODYSTRUCTURE: the raw prefix is parsed locally
+BODY_FEED_CHUNK = 8192
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+class BodyText:
+    """
+    Searchable text of a raw message, parsed incrementally with BytesFeedParser from at most
+    `budget` bytes (default IMAP_BODY_BYTE_CAP), decoded text capped the same way.
+    Only text/plain parts are decoded (text/html, tag-stripped, when there is no plain part);
+    DSN reports and returned headers are read as they are, and every other part is skipped
+    without decoding. `reason` records where the text came from for the run metrics:
+    "plain", "html", "no_text" or "parse_error"; `truncated` is set when the budget cut the message.
+    """
+
+    def __init__(self, raw, budget=None):
+        budget = IMAP_BODY_BYTE_CAP if budget is None else budget
+        self.truncated = len(raw) > budget
+        self.parts = []  # (content type, text) for parse_bounce_recipients
+        self.header_text = []
+        self.reason = "no_text"
+        self._lower = None
         try:
-            mail.select(folder, readonly=True)
+            parser = BytesFeedParser()
+            for start in range(0, min(len(raw), budget), BODY_FEED_CHUNK):
+                parser.feed(raw[start:min(start + BODY_FEED_CHUNK, budget)])
+            self._read(parser.close(), budget)
         except Exception:
-            continue  # skip folders that don't exist / can't be opened
+            self.reason = "parse_error"
+
+    def _read(self, msg, budget):
+        plain, html, size = [], [], 0
+        for part in msg.walk():
+            ctype = part.get_content_type()
+            if ctype in DSN_REPORT_TYPES:
+                blocks = part.get_payload()
+                if isinstance(blocks, list):
+                    self.parts.append((ctype, "\n\n".join(block.as_string() for block in blocks)))
+            elif ctype == "message/rfc822":
+                for inner in part.get_payload() or []:
+                    self.header_text += [_safe_decode_header(str(value)) for _, value in inner.items()]
+            elif ctype == "text/rfc822-headers":
+                self.header_text.append((part.get_payload(decode=True) or b"").decode(errors="ignore"))
+            elif ctype in ("text/plain", "text/html") and size < budget:
+                if "attachment" in str(part.get("Content-Disposition", "")).lower():
+                    continue
+                payload = (part.get_payload(decode=True) or b"")[:budget - size]
+                try:
+                    text = payload.decode(part.get_content_charset() or "utf-8", errors="ignore")
+                except LookupError:
+                    text = payload.decode(errors="ignore")
+                size += len(payload)
+                (plain if ctype == "text/plain" else html).append(text)
+        if plain:
+            self.reason = "plain"
+            self.parts += [("text/plain", text) for text in plain]
+        elif html:
+            self.reason = "html"
+            self.parts.append(("text/plain", HTML_TAG_RE.sub(" ", "\n".join(html))))
+
+    @property
+    def lower(self):
+        """Body, DSN and returned-header text, lowercased once per message."""
+        if self._lower is None:
+            self._lower = "\n".join([text for _, text in self.parts] + self.header_text).lower()
+        return self._lower
+
+    @property
+    def addresses(self):
+        return _extract_addresses(self.lower)
+
+def _summarize_headers(msg):
+    """Everything the classifier needs from a header block."""
+    from_addr = email.utils.parseaddr(msg.get("From", ""))[1].lower()
+    reply_to = email.utils.parseaddr(msg.get("Reply-To", ""))[1].lower()
+    subject = _safe_decode_header(msg.get("Subject"))
+    header_addrs = set()
+    for _, value in msg.items():
+        header_addrs |= _extract_addresses(_safe_decode_header(str(value)))
+    # Quick bounce-from check
+    from_is_bounce_source = ("mailer-daemon" in from_addr) or ("postmaster" in from_addr) or ("<> " in from_addr)
+    return {
+        "from": from_addr,
+        "reply_to": reply_to,
+        "subject": subject,
+        "date": _parse_msg_datetime(msg) or now(),
+        "is_bounce": from_is_bounce_source or bool(BOUNCE_SUBJECT_RE.search(subject)),
+        "header_addrs": header_addrs,
+    }
+
+def _uid_set(uids):
+    """Compress UIDs into an IMAP sequence set, e.g. [1, 2, 3, 7] -> "1:3,7"."""
+    ranges = []
+    for uid in sorted(int(u) for u in uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+def _header_summary(resp):
+    raw_headers = _fetch_item(resp, "BODY[HEADER.FIELDS (" + HEADER_FIELDS + ")]")
+    if raw_headers is None:
+        raw_headers = next((v for k, v in resp.items() if k.startswith("BODY[HEADER")), None)
+    if raw_headers is None:
+        return None
+    return _summarize_headers(email.message_from_bytes(raw_headers if isinstance(raw_headers, bytes) else b""))
 
-        # We'll search recent messages to reduce load — since last 30 days
-        since_date = (TODAY - timedelta(days=30)).strftime("%d-%b-%Y")
+def _body_fetch_plan(structure):
+    """
+    Decide which sections to download for phase 2. Returns (items, sections) where items is
+    the FETCH item list and sections describes how to decode each returned section.
+    Falls back to a capped prefix of the raw message when there is no usable BODYSTRUCTURE.
+    """
+    if not isinstance(structure, list):
+        # one byte past the cap, so BodyText can tell a message that was cut from one that fit
+        return f"(BODY.PEEK[]<0.{IMAP_BODY_BYTE_CAP + 1}>)", None
+    items, sections, budget = [], [], IMAP_BODY_BYTE_CAP
+    for section, ctype, charset, encoding, size in _body_sections(structure):
+        if budget <= 0:
+            break
+        if section.endswith(".HEADER"):
+            items.append(f"BODY.PEEK[{section}]")
+        else:
+            # Parts that fit the remaining budget ask for the full cap so that most
+            # messages share one item list and can be fetched in the same command
+            take = IMAP_BODY_BYTE_CAP if size and size <= budget else budget
+            items.append(f"BODY.PEEK[{section}]<0.{take}>")
+            budget -= min(size, budget) if size else budget
+        sections.append((section, ctype, charset, encoding))
+    if not items:
+        return None, []
+    return "(" + " ".join(items) + ")", sections
+
+def _body_scan(resp, sections, is_bounce):
+    """
+    Read the sections of a phase-2 FETCH response once. Returns (body_addrs, failed) where
+    failed is the bounce parser's result for bounce-like messages (None otherwise).
+    """
+    parts = []
+    if sections is None:
+        raw = _fetch_item(resp, "BODY[]")
+        if not isinstance(raw, bytes):
+            return set(), None
+        body = BodyText(raw)
+        metrics.add("body_text", calls=1, **{body.reason: 1}, truncated=int(body.truncated))
+        body_addrs = body.addresses
+        parts = body.parts
+    else:
+        body_addrs = set()
+        for section, ctype, charset, encoding in sections:
+            raw = _fetch_item(resp, f"BODY[{section}]")
+            if isinstance(raw, bytes):
+                text = _decode_part(raw, encoding, charset)
+                body_addrs |= _extract_addresses(text)
+                parts.append((ctype, text))
+    return body_addrs, (parse_bounce_recipients(parts) if is_bounce else None)
+
+def _fetch_by_uid(mail, uids, items, metric=None):
+    """One UID FETCH over a sequence set; returns {uid: response dict}."""
+    t0 = perf_counter()
+    res, data = mail.uid("FETCH", _uid_set(uids), items)
+    t1 = perf_counter()
+    if res != "OK":
+        raise imaplib.IMAP4.error(f"UID FETCH failed: {res}")
+    out = {}
+    for resp in _parse_fetch_response(data):
         try:
-            status, data = mail.search(None, f'(SINCE "{since_date}")')
-        except Exception:
-            try:
-                status, data = mail.search(None, 'ALL')
-            except Exception:
-                continue
+            out[int(resp.get("UID"))] = resp
+        except (TypeError, ValueError):
+            continue  # unsolicited FLAGS updates etc.
+    if metric:
+        metrics.add(metric + ".fetch", t1 - t0, messages=len(uids))
+        metrics.add(metric + ".parse", perf_counter() - t1, calls=0)
+    return out
 
-        if status != "OK":
-            continue
+def _scan_uids(mail, uids, needs_body, label="", metric=None):
+    """
+    Two-phase fetch over UID sequence sets of IMAP_FETCH_CHUNK messages per command.
+    Phase 1 pulls header fields + BODYSTRUCTURE for the whole chunk; phase 2 fetches the
+    text sections of the messages for which needs_body(summary) is true, one command per
+    distinct section layout. Yields (uid, summary, body_addrs, failed) in UID order as each
+    chunk completes; summary is None for messages that vanished from the folder and failed
+    holds the parsed bounce recipients (see _body_scan). With metric, FETCH round trips
+    are recorded as "<metric>.fetch" and response parsing as "<metric>.parse".
+    """
+    uids = sorted(int(u) for u in uids)
+    for start in range(0, len(uids), IMAP_FETCH_CHUNK):
+        chunk = uids[start:start + IMAP_FETCH_CHUNK]
+        t0 = perf_counter()
+        headers = _fetch_by_uid(mail, chunk, HEADER_FETCH, metric)
+        t1 = perf_counter()
+
+        summaries, plans = {}, {}
+        for uid in chunk:
+            resp = headers.get(uid)
+            summary = _header_summary(resp) if resp else None
+            summaries[uid] = summary
+            if summary is not None and needs_body(summary):
+                items, sections = _body_fetch_plan(resp.get("BODYSTRUCTURE"))
+                if items:
+                    plans.setdefault(items, []).append((uid, sections))
+        parse = perf_counter() - t1
+
+        scanned = {}
+        for items, members in plans.items():
+            bodies = _fetch_by_uid(mail, [uid for uid, _ in members], items, metric)
+            tp = perf_counter()
+            for uid, sections in members:
+                if uid in bodies:
+                    scanned[uid] = _body_scan(bodies[uid], sections, summaries[uid]["is_bounce"])
+            parse += perf_counter() - tp
+        t2 = perf_counter()
+        if metric:
+            metrics.add(metric + ".parse", parse)
+
+        print(f"[IMAP] {label} chunk {start // IMAP_FETCH_CHUNK + 1}: {len(chunk)} header(s) in "
+              f"{(t1 - t0) * 1000:.0f} ms, {len(scanned)} bodies in {len(plans)} command(s) / "
+              f"{(t2 - t1) * 1000:.0f} ms")
+        for uid in chunk:
+            body_addrs, failed = scanned.get(uid, (set(), None))
+            yield uid, summaries[uid], body_addrs, failed
+
+def _headers_settle(summary, lead_map):
+    """A direct, non-bounce message from a lead is classified without downloading its body."""
+    if summary["is_bounce"]:
+        return False
+    return summary["from"] in lead_map or summary["reply_to"] in lead_map
+
+def _lead_verdict(summary, body_addrs, failed, addr):
+    """How a message bears on one address: "bounce", "reply" or None."""
+    if summary["is_bounce"] and failed is not None:
+        # recognized bounce: only its failed recipients bounced; header mentions still count
+        if addr in failed:
+            return "bounce"
+        return "reply" if addr in summary["header_addrs"] else None
+    if addr in summary["header_addrs"] or addr in body_addrs:
+        # unrecognized bounce layout: any lead named in the body/DSN bounced
+        return "bounce" if summary["is_bounce"] and addr in body_addrs else "reply"
+    return None
+
+def _classify(summary, body_addrs, failed, lead_map):
+    """Returns hits mapping each lead email the message mentions to "bounce" or "reply"."""
+    hits = {}
+    for addr in sorted(summary["header_addrs"] | body_addrs | (failed or set())):
+        if addr in lead_map:
+            verdict = _lead_verdict(summary, body_addrs, failed, addr)
+            if verdict:
+                hits[addr] = verdict
+    return hits
+
+def _lead_send_dt(lead, date_field, time_field):
+    d = str(lead.get(date_field, "")).strip()
+    t = str(lead.get(time_field, "")).strip()
+    if not d or not t:
+        return None
+    try:
+        return datetime.strptime(f"{d} {t}", "%Y-%m-%d %H:%M").replace(tzinfo=TIMEZONE)
+    except:
+        return None
 
-        for num in data[0].split():
-            try:
-                res, msg_data = mail.fetch(num, "(RFC822)")
-                if res != "OK" or not msg_data:
-                    continue
-                raw = msg_data[0][1]
-                msg = email.message_from_bytes(raw)
-            except Exception:
+def _apply_message_hits(lead_map, folder, uid, msg_dt, hits):
+    for lead_email, kind in hits.items():
+        for lead in lead_map.get(lead_email, []):
+            if kind == "bounce":
+                lead["reply"] = f"bounced ({folder})"
+                print(f"[IMAP] Bounce for {lead_email} found in {folder} (uid {uid}).")
                 continue
 
-            from_addr = email.utils.parseaddr(msg.get("From", ""))[1].lower()
-            subject = _safe_decode_header(msg.get("Subject"))
-            body = _extract_body_text(msg)
-            msg_dt = _parse_msg_datetime(msg) or datetime.now(TIMEZONE)
+            # Otherwise it's a human reply or mention
+            # Determine which send it came after (FU2 > FU1 > initial > before initial)
+            # If the message datetime is after the respective send dt, mark accordingly
+            initial_dt = _lead_send_dt(lead, "initial date", "initial time")
+            fu1_dt = _lead_send_dt(lead, "follow-up 1 date", "follow-up 1 time")
+            fu2_dt = _lead_send_dt(lead, "follow-up 2 date", "follow-up 2 time")
+            if fu2_dt and msg_dt >= fu2_dt:
+                lead["reply"] = "after FU2"
+                print(f"[IMAP] Reply for {lead_email} after FU2 (folder {folder}).")
+            elif fu1_dt and msg_dt >= fu1_dt:
+                lead["reply"] = "after FU1"
+                print(f"[IMAP] Reply for {lead_email} after FU1 (folder {folder}).")
+            elif initial_dt and msg_dt >= initial_dt:
+                lead["reply"] = "after initial"
+                print(f"[IMAP] Reply for {lead_email} after initial (folder {folder}).")
+            else:
+                # Reply predates any recorded sends — still mark to avoid sending
+                lead["reply"] = "reply (pre-existing)"
+                print(f"[IMAP] Pre-existing reply for {lead_email} found in {folder}; skipping sends.")
+
+# === Shared IMAP connection ===
+_imap_conn = None
+
+def _open_imap():
+    t0 = perf_counter()
+    if IMAP_SSL:
+        mail = CountingIMAP4_SSL(IMAP_SERVER, IMAP_PORT)
+    else:
+        mail = CountingIMAP4(IMAP_SERVER, IMAP_PORT)
+    mail.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+    metrics.add("imap.connect", perf_counter() - t0, bytes_down=mail.bytes_down, bytes_up=mail.bytes_up)
+    return mail
 
-            # Quick bounce-from check
-            from_is_bounce_source = ("mailer-daemon" in from_addr) or ("postmaster" in from_addr) or ("<> " in from_addr)
+def imap_connect():
+    """
+    Return the run's authenticated IMAP connection, opening it on first use and
+    reconnecting if the server dropped it. The bulk scan and every per-lead check share it.
+    """
+    global _imap_conn
+    if _imap_conn is not None:
+        try:
+            if _imap_conn.noop()[0] == "OK":
+                return _imap_conn
+        except Exception:
+            pass
+        print("[IMAP] Connection went stale; reconnecting.")
+        _imap_conn = None
+    _imap_conn = _open_imap()
+    return _imap_conn
+
+def imap_logout():
+    global _imap_conn
+    if _imap_conn is not None:
+        try:
+            _imap_conn.logout()
+        except Exception:
+            pass
+        _imap_conn = None
 
-            # For each lead email present in either from, subject, or body, mark accordingly
-            # Note: this is O(m*n) but keeps behavior exact to your requirement
-            for lead_email, lead_list in lead_map.items():
-                if not lead_email:
-                    continue
-                matched = False
-                # check from
-                if lead_email in from_addr:
-                    matched = True
-                # check subject
-                elif lead_email in subject.lower():
-                    matched = True
-                # check body
-                elif lead_email in (body or "").lower():
-                    matched = True
-
-                if not matched:
-                    # if bounce-like from and lead email in body -> bounce
-                    if from_is_bounce_source and re.search(re.escape(lead_email), body or "", re.IGNORECASE):
-                        matched = True
-                        bounce_detected = True
-                    else:
-                        bounce_detected = False
-
-                if matched:
-                    for lead in lead_list:
-                        # compute lead send datetimes
-                        initial_dt = lead_send_dt(lead, "initial date", "initial time")
-                        fu1_dt = lead_send_dt(lead, "follow-up 1 date", "follow-up 1 time")
-                        fu2_dt = lead_send_dt(lead, "follow-up 2 date", "follow-up 2 time")
-
-                        # bounce detection determination
-                        is_bounce = False
-                        if from_is_bounce_source and re.search(re.escape(lead_email), body or "", re.IGNORECASE):
-                            is_bounce = True
-                        # also consider bounce if subject contains common bounce phrases
-                        if re.search(r"undeliver|delivery failure|delivery status notification|failure notice|returned mail|delivery failed", subject, re.IGNORECASE):
-                            if re.search(re.escape(lead_email), body or "", re.IGNORECASE):
-                                is_bounce = True
-
-                        if is_bounce:
-                            lead["reply"] = f"bounced ({folder})"
-                            print(f"[IMAP] Bounce for {lead_email} found in {folder} (msg {num.decode() if isinstance(num, bytes) else num}).")
-                            continue
-
-                        # Otherwise it's a human reply or mention
-                        # Determine which send it came after (FU2 > FU1 > initial > before initial)
-                        # If the message datetime is after the respective send dt, mark accordingly
-                        if fu2_dt and msg_dt >= fu2_dt:
-                            lead["reply"] = "after FU2"
-                            print(f"[IMAP] Reply for {lead_email} after FU2 (folder {folder}).")
-                        elif fu1_dt and msg_dt >= fu1_dt:
-                            lead["reply"] = "after FU1"
-                            print(f"[IMAP] Reply for {lead_email} after FU1 (folder {folder}).")
-                        elif initial_dt and msg_dt >= initial_dt:
-                            lead["reply"] = "after initial"
-                            print(f"[IMAP] Reply for {lead_email} after initial (folder {folder}).")
-                        else:
-                            # Reply predates any recorded sends — still mark to avoid sending
-                            lead["reply"] = "reply (pre-existing)"
-                            print(f"[IMAP] Pre-existing reply for {lead_email} found in {folder}; skipping sends.")
+def _imap_quote(value):
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
 
+# === Incremental scan state ===
+def load_imap_state(path=IMAP_STATE_FILE):
     try:
-        mail.logout()
-    except Exception:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if isinstance(state.get("folders"), dict):
+            return state
+    except FileNotFoundError:
         pass
+    except Exception as e:
+        print(f"[IMAP] Ignoring unreadable state file {path}: {e}")
+    return {"folders": {}}
 
-# Helper: per-lead focused check (used right before each send to be extra-safe)
-def has_recent_reply_or_bounce(lead, since_dt):
+def save_imap_state(state, path=IMAP_STATE_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def _lead_emails_digest(lead_map):
+    return hashlib.sha1("\n".join(sorted(lead_map)).encode("utf-8")).hexdigest()
+
+def _select_uidvalidity(mail, folder):
+    """Select folder read-only; returns its UIDVALIDITY or None if it can't be opened."""
+    try:
+        status, _ = mail.select(folder, readonly=True)
+        if status != "OK":
+            return None
+        _, data = mail.response("UIDVALIDITY")
+        return int(data[0]) if data and data[0] else 0
+    except Exception:
+        return None
+
+def _scan_folder(mail, folder, folder_state, lead_map, cutoff):
     """
-    Check mailbox for replies/bounces for a single lead since `since_dt`.
-    since_dt should be a timezone-aware datetime in TIMEZONE (or None).
-    Returns (found: bool, reason: str).
+    Bring one folder's scan state up to date. Touches no leads, so folders can be
+    scanned on separate connections. Returns the new folder state, or None if the
+    folder doesn't exist / can't be opened.
     """
-    lead_email = str(lead.get("email", "")).strip().lower()
-    if not lead_email:
-        return False, "no email"
+    folder_started = perf_counter()
+    with metrics.timed(f"reply_scan.{folder}.select", mail):
+        uidvalidity = _select_uidvalidity(mail, folder)
+    if uidvalidity is None:
+        return None
+    down, up = _conn_bytes(mail)
+
+    if not folder_state or folder_state.get("uidvalidity") != uidvalidity:
+        if folder_state:
+            print(f"[IMAP] UIDVALIDITY changed for {folder}; full rescan.")
+        folder_state = {"uidvalidity": uidvalidity, "last_uid": 0, "messages": {}}
+        criteria = f'(SINCE "{cutoff.strftime("%d-%b-%Y")}")'
+    else:
+        folder_state = dict(folder_state, messages=dict(folder_state["messages"]))
+        criteria = f'(UID {folder_state["last_uid"] + 1}:*)'
 
     try:
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-        mail.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+        with metrics.timed(f"reply_scan.{folder}.search", mail):
+            status, data = mail.uid("SEARCH", None, criteria)
+    except Exception:
+        return None
+    if status != "OK":
+        return None
+
+    # "n:*" always matches the highest UID, so drop anything at or below the watermark
+    new_uids = sorted(u for u in map(int, data[0].split()) if u > folder_state["last_uid"])
+    fetched, matching = 0, 0.0
+    try:
+        for uid, summary, body_addrs, failed in _scan_uids(mail, new_uids, lambda summary: not _headers_settle(summary, lead_map),
+                                                           folder, metric=f"reply_scan.{folder}"):
+            t0 = perf_counter()
+            if summary is not None:
+                hits = _classify(summary, body_addrs, failed, lead_map)
+                if hits:
+                    folder_state["messages"][str(uid)] = {"date": summary["date"].isoformat(), "hits": hits}
+            folder_state["last_uid"] = uid
+            fetched += 1
+            matching += perf_counter() - t0
     except Exception as e:
-        print(f"[IMAP] per-lead connect error: {e}")
-        return False, "imap error"
+        # the watermark stays below the failed chunk so the next run retries it
+        print(f"[IMAP] {folder}: fetch error after {fetched} message(s): {e}")
+
+    # Drop classifications that fell out of the lookback window
+    folder_state["messages"] = {
+        uid: rec for uid, rec in folder_state["messages"].items()
+        if datetime.fromisoformat(rec["date"]) >= cutoff
+    }
+    down2, up2 = _conn_bytes(mail)
+    metrics.add(f"reply_scan.{folder}.match", matching)
+    metrics.add(f"reply_scan.{folder}", perf_counter() - folder_started, messages=fetched, bytes_down=down2 - down, bytes_up=up2 - up)
+    print(f"[IMAP] {folder}: {fetched} new message(s), {len(folder_state['messages'])} cached match(es).")
+    return folder_state
+
+def _scan_folders_parallel(folders, state, lead_map, cutoff, workers):
+    """
+    Scan folders on a bounded pool of IMAP connections (one per worker thread).
+    Returns {folder: folder_state or None}.
+    """
+    local = threading.local()
+    opened, lock = [], threading.Lock()
+
+    def scan(folder):
+        try:
+            mail = getattr(local, "mail", None)
+            if mail is None:
+                mail = local.mail = _open_imap()
+                with lock:
+                    opened.append(mail)
+            return _scan_folder(mail, folder, state["folders"].get(folder), lead_map, cutoff)
+        except Exception as e:
+            print(f"[IMAP] {folder}: scan failed: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = dict(zip(folders, pool.map(scan, folders)))
+    for mail in opened:
+        try:
+            mail.logout()
+        except Exception:
+            pass
+    return results
+
+def detect_reply_status(leads, new_only=False):
+    """
+    Scans IMAP folders and marks leads with 'reply' if we detect a reply or bounce.
+    It compares message date to each lead's last send time to decide whether the reply occurred after
+    initial / FU1 / FU2.
+
+    Only messages above each folder's persisted UID watermark are fetched; messages
+    classified on earlier runs are replayed from IMAP_STATE_FILE. A folder is fully
+    rescanned when its UIDVALIDITY changes or the set of lead emails changes.
+    With IMAP_SCAN_WORKERS > 1 folders are scanned concurrently; results are still
+    applied in IMAP_FOLDERS order, so lead statuses match a serial scan.
+    new_only applies just the messages classified by this call, for callers whose leads
+    already carry the earlier results (replayed from the journal); a rescan applies all.
+    """
+    print("[IMAP] Scanning mailbox for replies/bounces...")
+    workers = min(IMAP_SCAN_WORKERS, len(IMAP_FOLDERS))
+    if workers <= 1:
+        try:
+            mail = imap_connect()
+        except Exception as e:
+            print(f"[IMAP] Connection error: {e}")
+            return
+
+    # Normalize leads index by email for quick lookup
+    lead_map = {}
+    for lead in leads:
+        email_key = str(lead.get("email", "")).strip().lower()
+        if email_key:
+            lead_map.setdefault(email_key, []).append(lead)
+
+    state = load_imap_state()
+    digest = _lead_emails_digest(lead_map)
+    if state.get("lead_digest") != digest:
+        if state["folders"]:
+            print("[IMAP] Lead emails changed since last scan; rescanning all folders.")
+        state = {"folders": {}, "lead_digest": digest}
+
+    # We only consider recent messages to reduce load — since last 30 days
+    cutoff = now() - timedelta(days=IMAP_LOOKBACK_DAYS)
+    previous = dict(state["folders"])
+
+    # Scan folders
+    if workers > 1:
+        results = _scan_folders_parallel(IMAP_FOLDERS, state, lead_map, cutoff, workers)
+    else:
+        results = {}
+        for folder in IMAP_FOLDERS:
+            results[folder] = _scan_folder(mail, folder, state["folders"].get(folder), lead_map, cutoff)
+
+    for folder in IMAP_FOLDERS:
+        folder_state = results.get(folder)
+        if folder_state is None:
+            continue  # skip folders that don't exist / can't be opened
+        state["folders"][folder] = folder_state
+        known = {}
+        if new_only and previous.get(folder, {}).get("uidvalidity") == folder_state["uidvalidity"]:
+            known = previous[folder]["messages"]
+
+        # Replay every known classification in UID order, exactly like a full scan would
+        for uid, rec in sorted(folder_state["messages"].items(), key=lambda item: int(item[0])):
+            if uid in known:
+                continue
+            _apply_message_hits(lead_map, folder, uid, datetime.fromisoformat(rec["date"]), rec["hits"])
+
+    try:
+        save_imap_state(state)
+    except Exception as e:
+        print(f"[IMAP] Could not save scan state: {e}")
+
+def _response_int(mail, code):
+    try:
+        _, data = mail.response(code)
+        return int(data[0]) if data and data[0] else None
+    except (TypeError, ValueError):
+        return None
 
+def check_lead_mailbox(mail, lead_email, since_dt, after=None, metric="presend"):
+    """
+    Look for a reply or bounce from one lead on the given connection.
+    The address filter runs server-side (SEARCH SINCE <d> OR FROM <addr> TEXT <addr>),
+    so only the few matching messages are fetched and classified.
+
+    after is the marks of an earlier check of the same lead ({folder: (uidvalidity,
+    last uid)}); folders whose UIDVALIDITY is unchanged are then only searched above
+    that UID. Returns (found, reason, marks) with marks for the folders this check
+    searched and scanned completely; a folder that errored gets no mark, so a later
+    check given these marks searches all of it again.
+    """
     # Use SINCE search using date only if since_dt provided
-    since_str = None
     if isinstance(since_dt, datetime):
         since_str = since_dt.strftime("%d-%b-%Y")
     else:
-        since_str = (TODAY - timedelta(days=30)).strftime("%d-%b-%Y")
+        since_str = (now().date() - timedelta(days=30)).strftime("%d-%b-%Y")
+    addr = _imap_quote(lead_email)
+    criteria = f'SINCE "{since_str}" OR FROM {addr} TEXT {addr}'
 
-    for folder in IMAP_FOLDERS:
-        try:
-            mail.select(folder, readonly=True)
-        except Exception:
-            continue
-        try:
-            status, data = mail.search(None, f'(SINCE "{since_str}")')
-        except Exception:
+    # a direct reply is settled by its headers; anything else needs the text parts
+    def needs_body(summary):
+        return summary["is_bounce"] or lead_email not in summary["header_addrs"]
+
+    marks = {}
+    down, up = _conn_bytes(mail)
+    try:
+        for folder in IMAP_FOLDERS:
             try:
-                status, data = mail.search(None, 'ALL')
+                with metrics.timed(metric + ".search", mail):
+                    status, _ = mail.select(folder, readonly=True)
+                    if status != "OK":
+                        continue
+                    uidvalidity = _response_int(mail, "UIDVALIDITY")
+                    uidnext = _response_int(mail, "UIDNEXT")
+                    prior = (after or {}).get(folder)
+                    floor = prior[1] if prior and uidvalidity is not None and prior[0] == uidvalidity else 0
+                    # anything delivered after the SELECT gets a UID >= UIDNEXT; the mark is
+                    # only kept once the folder was searched and scanned without errors
+                    mark = (uidvalidity, uidnext - 1) if uidnext else None
+                    search = f"(UID {floor + 1}:* {criteria})" if floor else f"({criteria})"
+                    status, data = mail.uid("SEARCH", None, search)
             except Exception:
                 continue
 
-        if status != "OK":
-            continue
+            if status != "OK":
+                continue
+            # "n:*" always matches the highest UID, so drop anything at or below the floor
+            uids = [u for u in data[0].split() if int(u) > floor] if data and data[0] else []
 
-        for num in data[0].split():
+            # the server match is a substring hit; confirm it against the parsed addresses
             try:
-                res, msg_data = mail.fetch(num, "(RFC822)")
-                if res != "OK" or not msg_data:
-                    continue
-                msg = email.message_from_bytes(msg_data[0][1])
+                for uid, summary, body_addrs, failed in _scan_uids(mail, uids, needs_body, folder, metric=metric):
+                    if summary is None:
+                        continue
+                    verdict = _lead_verdict(summary, body_addrs, failed, lead_email)
+                    if verdict == "bounce":
+                        return True, f"bounced ({folder})", marks
+                    if verdict == "reply":
+                        return True, f"reply in {folder}", marks
             except Exception:
                 continue
+            if mark:
+                marks[folder] = mark
+    finally:
+        down2, up2 = _conn_bytes(mail)
+        metrics.add(metric, calls=0, bytes_down=down2 - down, bytes_up=up2 - up)
+    return False, "", marks
 
-            from_addr = email.utils.parseaddr(msg.get("From", ""))[1].lower()
-            subject = _safe_decode_header(msg.get("Subject"))
-            body = _extract_body_text(msg)
-            msg_dt = _parse_msg_datetime(msg) or datetime.now(TIMEZONE)
-
-            # direct reply
-            if lead_email in from_addr or lead_email in subject.lower() or re.search(re.escape(lead_email), body or "", re.IGNORECASE):
-                # bounce heuristics
-                if ("mailer-daemon" in from_addr) or ("postmaster" in from_addr) or re.search(r"undeliver|delivery failure|returned mail", subject, re.IGNORECASE):
-                    if re.search(re.escape(lead_email), body or "", re.IGNORECASE):
-                        try:
-                            mail.logout()
-                        except:
-                            pass
-                        return True, f"bounced ({folder})"
-                try:
-                    mail.logout()
-                except:
-                    pass
-                return True, f"reply in {folder}"
+# Helper: per-lead focused check (used right before each send to be extra-safe)
+def has_recent_reply_or_bounce(lead, since_dt, after=None):
+    """
+    Check mailbox for replies/bounces for a single lead since `since_dt` on the shared
+    connection. since_dt should be a timezone-aware datetime in TIMEZONE (or None); after
+    limits the search to mail newer than an earlier check (see check_lead_mailbox).
+    Returns (found: bool, reason: str, marks).
+    """
+    lead_email = str(lead.get("email", "")).strip().lower()
+    if not lead_email:
+        return False, "no email", {}
 
     try:
-        mail.logout()
-    except:
-        pass
-    return False, ""
+        mail = imap_connect()
+    except Exception as e:
+        print(f"[IMAP] per-lead connect error: {e}")
+        return False, "imap error", {}
+    return check_lead_mailbox(mail, lead_email, since_dt, after)
 
 # === Send rules ===
 def can_send_initial(lead):
@@ -376,83 +1274,435 @@ def next_monday(date_obj):
     days_ahead = 7 - date_obj.weekday()
     return date_obj + timedelta(days=days_ahead)
 
-def can_send_followup(lead, step):
+# FU1 goes out 3 days after the initial, FU2 4 days after; weekend dates roll to Monday
+FOLLOWUP_STEPS = {2: ("fu1", "FU1", "follow-up 1 date", "email 2", 3),
+                  3: ("fu2", "FU2", "follow-up 2 date", "email 3", 4)}
+
+def _parse_date(value):
+    value = str(value or "").strip()
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def followup_due_date(initial_date, step):
+    scheduled_date = initial_date + timedelta(days=FOLLOWUP_STEPS[step][4])
+    if is_weekend(scheduled_date):
+        scheduled_date = next_monday(scheduled_date)
+    return scheduled_date
+
+def _followup_block_reason(lead, initial_date, step):
     """
-    Determine if a follow-up can be sent.
-    step = 2 → FU1
-    step = 3 → FU2
-    This function assumes detect_reply_status() has been run earlier,
-    but still checks the 'reply' field.
+    None if follow-up `step` (2 = FU1, 3 = FU2) is pending for this lead, otherwise why it
+    can't go out. The due date is not checked here; see followup_due_date().
+    initial_date is the lead's parsed 'initial date' (None when blank).
     """
+    _, label, sent_field, body_field, _ = FOLLOWUP_STEPS[step]
 
     def is_empty(value):
         return value is None or str(value).strip() == ""
 
     # Skip if there's any known reply
     if str(lead.get("reply", "no reply")).strip().lower() != "no reply":
-        print(f"[SKIP FU{step}] Lead {lead.get('email')} already replied ({lead.get('reply')}).")
-        return False
+        return "already replied"
+    # Skip if main email missing or nothing sent yet
+    if is_empty(lead.get("email")) or initial_date is None:
+        return "not started"
+    if not is_empty(lead.get(sent_field)):
+        return f"{label} already sent"
+    if is_empty(lead.get(body_field)):
+        return f"missing '{body_field}'"
+    return None
+
+def lead_schedule(lead, first_seen):
+    """
+    Date-independent schedule for one lead: {"due": {step: iso date}, "blocked": {label: reason}}.
+    A pending initial is due from first_seen (the day the lead was first indexed unsent),
+    follow-ups from followup_due_date(); steps that can't go out record why under "blocked".
+    """
+    due, blocked = {}, {}
+    if can_send_initial(lead):
+        # send_to_lead() refuses a flagged lead, so it must not hold a place in the queue
+        if str(lead.get("reply", "no reply")).strip().lower() != "no reply":
+            blocked["initial"] = "already replied"
+        else:
+            due["initial"] = first_seen
+    try:
+        initial_date = _parse_date(lead.get("initial date"))
+    except ValueError:
+        blocked["FU"] = "bad 'initial date'"
+        return {"due": due, "blocked": blocked}
+    for step in (3, 2):
+        key, label = FOLLOWUP_STEPS[step][:2]
+        reason = _followup_block_reason(lead, initial_date, step)
+        if reason is None:
+            due[key] = followup_due_date(initial_date, step).isoformat()
+        elif reason != "not started":
+            blocked[label] = reason
+    return {"due": due, "blocked": blocked}
+
+# === Scheduler index ===
+SCHEDULE_INDEX_FILE = account_path("leads/schedule_index.json")
+SCHEDULE_STEPS = ("fu2", "fu1", "initial")  # send priority when a lead is due in several
+SCHEDULE_FIELDS = ("email", "email 1", "email 2", "email 3", "initial date",
+                   "follow-up 1 date", "follow-up 2 date", "reply")
+SCHEDULE_RULES = 2  # bump when lead_schedule() changes, so every entry is recomputed once
+
+def _lead_fingerprint(lead):
+    raw = "\x1f".join([str(SCHEDULE_RULES)] + [str(lead.get(f, "")) for f in SCHEDULE_FIELDS])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+class ScheduleIndex:
+    """
+    Per-step min-heaps of [due date, lead key], so the day's sends come off the heap tops
+    rather than from a scan over every lead.
+
+    The file keeps each lead's entry (fingerprint, first-seen date, due dates and blocked
+    steps), one per line sorted by key so a run's diff shows only the leads it touched;
+    the heaps are heapified from the entries on load. Entries are recomputed only for
+    leads whose scheduling fields changed since the last run (tracked by fingerprint).
+    Superseded heap items are dropped lazily when they reach the top, and the heaps are
+    rebuilt once stale items outnumber live ones. Ties on the due date break on the lead
+    key, never on file order.
+    """
 
-    # Skip if main email missing
-    if is_empty(lead.get("email")):
-        return False
+    def __init__(self, path=SCHEDULE_INDEX_FILE):
+        self.path = path
+        self.entries = {}
+        self.heaps = {step: [] for step in SCHEDULE_STEPS}
+        self.leads = {}
+        self.keys = {}
+        self.changed = 0
+        self.dirty = False  # entries differ from the file
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if "entries" in entry:
+                        # single-object file from before one entry per line
+                        self.entries.update(entry["entries"])
+                        self.dirty = True
+                    else:
+                        self.entries[entry.pop("key")] = entry
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[Schedule] Ignoring unreadable index {path}: {e}")
+            self.entries = {}
+        self._rebuild()
+
+    def sync(self, keyed_leads, today=None):
+        """Bind this run's (key, lead) pairs and re-index the leads that changed."""
+        today = today or now().date()
+        self.leads = dict(keyed_leads)
+        self.keys = {id(lead): key for key, lead in self.leads.items()}
+        for key in set(self.entries) - set(self.leads):
+            del self.entries[key]
+            self.dirty = True
+        self.changed = sum(1 for key in self.leads if self._refresh(key, today))
+        live = sum(len(entry["due"]) for entry in self.entries.values())
+        if sum(len(heap) for heap in self.heaps.values()) > 2 * live + 64:
+            self._rebuild()
+
+    def update(self, lead, today=None):
+        """Re-index one lead after it was sent to or marked during this run."""
+        key = self.keys.get(id(lead))
+        if key is not None:
+            self._refresh(key, today or now().date())
+
+    def _refresh(self, key, today):
+        lead = self.leads[key]
+        fp = _lead_fingerprint(lead)
+        old = self.entries.get(key)
+        if old and old["fp"] == fp:
+            return False
+        first_seen = old["first_seen"] if old else today.isoformat()
+        entry = {"fp": fp, "first_seen": first_seen, **lead_schedule(lead, first_seen)}
+        self.entries[key] = entry
+        self.dirty = True
+        old_due = old["due"] if old else {}
+        for step, due in entry["due"].items():
+            if old_due.get(step) != due:
+                heapq.heappush(self.heaps[step], [due, key])
+        return True
 
-    try:
-        if step == 2:  # FU1 rules
-            if is_empty(lead.get("initial date")):
-                return False
-            if not is_empty(lead.get("follow-up 1 date")):
-                print(f"[SKIP FU1] Already sent FU1 to {lead.get('email')}.")
-                return False
-            if is_empty(lead.get("email 2")):
-                print(f"[SKIP FU1] Missing 'email 2' for {lead.get('email')}.")
-                return False
-
-            # FU1 should be sent 3 days after initial date, skip weekends
-            initial_date = datetime.strptime(lead['initial date'], "%Y-%m-%d").date()
-            scheduled_date = initial_date + timedelta(days=3)
-            if is_weekend(scheduled_date):
-                scheduled_date = next_monday(scheduled_date)
-
-            if TODAY < scheduled_date:
-                print(f"[SKIP FU1] Too early for FU1 to {lead.get('email')} (scheduled for {scheduled_date}).")
-                return False
-            if TODAY > scheduled_date:
-                # It's past scheduled date, send anyway
-                return True
-            # TODAY == scheduled_date
-            return True
-
-        elif step == 3:  # FU2 rules
-            if is_empty(lead.get("initial date")):
-                return False
-            if not is_empty(lead.get("follow-up 2 date")):
-                print(f"[SKIP FU2] Already sent FU2 to {lead.get('email')}.")
-                return False
-            if is_empty(lead.get("email 3")):
-                print(f"[SKIP FU2] Missing 'email 3' for {lead.get('email')}.")
-                return False
-
-            # FU2 should be sent 4 days after initial date, skip weekends
-            initial_date = datetime.strptime(lead['initial date'], "%Y-%m-%d").date()
-            scheduled_date = initial_date + timedelta(days=4)
-            if is_weekend(scheduled_date):
-                scheduled_date = next_monday(scheduled_date)
-
-            if TODAY < scheduled_date:
-                print(f"[SKIP FU2] Too early for FU2 to {lead.get('email')} (scheduled for {scheduled_date}).")
-                return False
-            if TODAY > scheduled_date:
-                # It's past scheduled date, send anyway
-                return True
-            # TODAY == scheduled_date
-            return True
+    def _rebuild(self):
+        self.heaps = {step: [] for step in SCHEDULE_STEPS}
+        for key, entry in self.entries.items():
+            for step, due in entry["due"].items():
+                self.heaps[step].append([due, key])
+        for heap in self.heaps.values():
+            heapq.heapify(heap)
+
+    def _live(self, step, item):
+        entry = self.entries.get(item[1])
+        return entry is not None and entry["due"].get(step) == item[0]
+
+    def next_send(self, today=None):
+        """
+        (step, lead) for the highest-priority step whose earliest item is due by `today`,
+        else None: a peek at each heap top, popping the superseded items it finds there.
+        """
+        today = (today or now().date()).isoformat()
+        for step in SCHEDULE_STEPS:
+            heap = self.heaps[step]
+            while heap and not self._live(step, heap[0]):
+                heapq.heappop(heap)
+            if heap and heap[0][0] <= today:
+                return step, self.leads[heap[0][1]]
+        return None
 
-    except Exception as e:
-        print(f"[ERROR FU{step}] {lead.get('email')}: {e}")
-        return False
+    def day_plan(self, today=None, limit=None):
+        """
+        Every send due by `today`, in send order: step priority, then due date, then key.
+        Each lead appears once, under its highest-priority step. Walks the heap arrays
+        without popping, so k due items cost O(k log k) regardless of how many are pending.
+        """
+        today = (today or now().date()).isoformat()
+        plan, planned = [], set()
+        for step in SCHEDULE_STEPS:
+            heap = self.heaps[step]
+            frontier = [(heap[0], 0)] if heap else []
+            while frontier and (limit is None or len(plan) < limit):
+                item, i = heapq.heappop(frontier)
+                if item[0] > today:
+                    break
+                if self._live(step, item) and item[1] not in planned:
+                    plan.append((step, self.leads[item[1]]))
+                    planned.add(item[1])
+                for child in (2 * i + 1, 2 * i + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child], child))
+        return plan
+
+    def report(self, plan, today=None):
+        today = (today or now().date()).isoformat()
+        ready = Counter(step for step, _ in plan)
+        skips = Counter()
+        for entry in self.entries.values():
+            for label, reason in entry["blocked"].items():
+                skips[(label, reason)] += 1
+            for step, due in entry["due"].items():
+                if due > today:
+                    skips[(step.upper(), "too early")] += 1
+        print(f"[Schedule] {len(self.entries)} lead(s) indexed, {self.changed} re-indexed this run.")
+        print(f"[Schedule] Ready: FU2 {ready['fu2']}, FU1 {ready['fu1']}, initial {ready['initial']}")
+        for (label, reason), count in sorted(skips.items()):
+            print(f"[Schedule] Skipped {label}: {reason} x{count}")
+
+    def save(self):
+        """Write the entries back, if any changed since the file was read or last saved."""
+        if not self.dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for key in sorted(self.entries):
+                f.write(json.dumps({"key": key, **self.entries[key]}, ensure_ascii=False,
+                                   separators=(",", ":"), sort_keys=True) + "\n")
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+# === Send pacing ===
+class TokenBucket:
+    """Holds up to `burst` sends and refills at `rate_per_hour`; a rate of 0 never limits."""
+
+    def __init__(self, rate_per_hour, burst):
+        self.rate = max(0.0, rate_per_hour) / 3600
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.at = None
+
+    def _level(self, t):
+        if self.at is None:
+            return self.tokens
+        return min(self.burst, self.tokens + max(0.0, (t - self.at).total_seconds()) * self.rate)
+
+    def ready_at(self, t):
+        """Earliest time at or after t when a send is allowed."""
+        level = self._level(t)
+        if level >= 1 or not self.rate:
+            return t
+        return t + timedelta(seconds=(1 - level) / self.rate)
+
+    def take(self, t):
+        self.tokens = self._level(t) - 1
+        self.at = t
+
+def recipient_domain(addr):
+    return str(addr).rsplit("@", 1)[-1].strip().lower()
+
+class SendPacer:
+    """
+    Token buckets for this account as a whole and for each recipient domain it sends to.
+    A message may go out once both its buckets hold a token, so sends pack as densely as
+    the limits allow while no domain sees a burst. The buckets start from the sends already
+    stamped on the account's leads today, so separate single-mode runs pace each other too.
+    """
+
+    def __init__(self, rate_per_hour, burst):
+        self.total = TokenBucket(rate_per_hour, burst)
+        self.domains = {}
+
+    def _bucket(self, domain):
+        bucket = self.domains.get(domain)
+        if bucket is None:
+            bucket = self.domains[domain] = TokenBucket(DOMAIN_RATE_PER_HOUR, DOMAIN_BURST)
+        return bucket
+
+    def ready_at(self, lead, t):
+        return self._bucket(recipient_domain(lead.get("email", ""))).ready_at(self.total.ready_at(t))
+
+    def take(self, lead, t):
+        self.total.take(t)
+        self._bucket(recipient_domain(lead.get("email", ""))).take(t)
+
+    def replay(self, leads, until):
+        """Charge the buckets for every send stamped on these leads earlier on the day of `until`, in time order."""
+        day = until.date()
+        sends = []
+        for lead in leads:
+            for date_field, time_field in (("initial date", "initial time"), ("follow-up 1 date", "follow-up 1 time"),
+                                           ("follow-up 2 date", "follow-up 2 time")):
+                if lead.get(date_field) == day.isoformat():
+                    try:
+                        sent_at = datetime.strptime(f"{day} {lead.get(time_field)}", "%Y-%m-%d %H:%M")
+                    except ValueError:
+                        continue
+                    sent_at = sent_at.replace(tzinfo=TIMEZONE)
+                    if sent_at <= until:
+                        sends.append((sent_at, lead))
+        sends.sort(key=lambda item: item[0])
+        for sent_at, lead in sends:
+            self.take(lead, sent_at)
+
+    def plan(self, items, start, limit, until):
+        """
+        Order (step, lead) items for sending from `start`: on a copy of the buckets,
+        repeatedly take the item that can go out soonest, earlier items first on ties,
+        until `limit` are placed or the next would land after `until`.
+        Returns [(send_at, step, lead)].
+        """
+        sim = copy.deepcopy(self)
+        by_domain = {}
+        for position, (step, lead) in enumerate(items):
+            by_domain.setdefault(recipient_domain(lead.get("email", "")), []).append((position, step, lead))
+        heads = {domain: 0 for domain in by_domain}
+        planned = []
+        t = start
+        while heads and len(planned) < limit:
+            t = sim.total.ready_at(t)
+            best = None
+            for domain, index in heads.items():
+                position, step, lead = by_domain[domain][index]
+                candidate = (sim._bucket(domain).ready_at(t), position, domain)
+                if best is None or candidate < best:
+                    best = candidate
+            send_at, _, domain = best
+            if send_at > until:
+                break
+            _, step, lead = by_domain[domain][heads[domain]]
+            sim.take(lead, send_at)
+            planned.append((send_at, step, lead))
+            heads[domain] += 1
+            if heads[domain] == len(by_domain[domain]):
+                del heads[domain]
+        return planned
+
+# === SMTP session ===
+class SMTPSession:
+    """
+    One authenticated SMTP connection reused for every message in the run.
+    The connection is checked with NOOP before each use, re-established when the server
+    has dropped it, and connect / auth / send latencies are recorded separately.
+    """
+
+    def __init__(self, host, port, user, password, ssl=True):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self.user = user
+        self.password = password
+        self.smtp = None
+        self.timings = {"connect": [], "auth": [], "send": []}
+
+    def _connect(self):
+        t0 = perf_counter()
+        if self.ssl:
+            smtp = CountingSMTP_SSL(self.host, self.port)
+        else:
+            smtp = CountingSMTP(self.host, self.port)
+        t1 = perf_counter()
+        connect_bytes = _conn_bytes(smtp)
+        try:
+            smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        t2 = perf_counter()
+        self.timings["connect"].append(t1 - t0)
+        self.timings["auth"].append(t2 - t1)
+        auth_bytes = _conn_bytes(smtp)
+        metrics.add("smtp.connect", t1 - t0, bytes_down=connect_bytes[0], bytes_up=connect_bytes[1])
+        metrics.add("smtp.auth", t2 - t1, bytes_down=auth_bytes[0] - connect_bytes[0],
+                    bytes_up=auth_bytes[1] - connect_bytes[1])
+        self.smtp = smtp
+
+    def _drop(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+        self.smtp = None
+
+    def _alive(self):
+        if self.smtp is None:
+            return False
+        try:
+            return self.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def ensure(self):
+        if not self._alive():
+            self._drop()
+            self._connect()
+        return self.smtp
+
+    def send(self, msg, from_addr):
+        self.ensure()
+        t0 = perf_counter()
+        down, up = _conn_bytes(self.smtp)
+        try:
+            self.smtp.send_message(msg, from_addr=from_addr)
+        except smtplib.SMTPServerDisconnected:
+            print("[SMTP] Server disconnected; reconnecting.")
+            self._drop()
+            self._connect()
+            t0 = perf_counter()
+            down, up = _conn_bytes(self.smtp)
+            self.smtp.send_message(msg, from_addr=from_addr)
+        seconds = perf_counter() - t0
+        self.timings["send"].append(seconds)
+        down2, up2 = _conn_bytes(self.smtp)
+        metrics.add("smtp.send", seconds, bytes_down=down2 - down, bytes_up=up2 - up)
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+        self.smtp = None
+
+    def report(self):
+        for phase, samples in self.timings.items():
+            if samples:
+                print(f"[SMTP] {phase}: {len(samples)}x, avg {sum(samples) / len(samples) * 1000:.0f} ms, "
+                      f"total {sum(samples) * 1000:.0f} ms")
 
-    return False
+smtp_session = SMTPSession(SMTP_SERVER, SMTP_PORT, EMAIL_ADDRESS, EMAIL_PASSWORD, ssl=SMTP_SSL)
 
 # === Email send function ===
 def send_email(to, subject, content):
@@ -463,122 +1713,409 @@ def send_email(to, subject, content):
     msg["From"] = FROM_EMAIL
     msg["To"] = to
     msg.set_content(content)
-    with smtplib.SMTP_SSL(SMTP_SERVER, SMTP_PORT) as smtp:
-        smtp.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        smtp.send_message(msg, from_addr=FROM_EMAIL)
+    smtp_session.send(msg, FROM_EMAIL)
 
 # === Load and preprocess leads ===
-leads = read_multiline_ndjson(LEADS_FILE)
-for lead in leads:
-    if is_minimal_url_only(lead):
-        continue
-    for f in ["email", "email 1", "email 2", "email 3", "business name", "first name", "subject",
-              "initial date", "follow-up 1 date", "follow-up 2 date",
-              "initial time", "follow-up 1 time", "follow-up 2 time", "reply"]:
-        lead.setdefault(f, "")
-    if not lead["reply"]:
-        lead["reply"] = "no reply"
-    for key in list(lead):
-        if key.startswith(("message id", "in-reply-to", "references")):
-            del lead[key]
-
-# Run a bulk IMAP scan to update reply/bounce status before we pick a queue
-detect_reply_status(leads)
-
-# === Quota logic ===
-BASE_QUOTA = 70
-backlogs = sum(1 for l in leads if can_send_followup(l, 2) or can_send_followup(l, 3))
-
-# Removed extra 20 for recent initials - only base quota + backlogs capped at 20
-extra_quota = min(20, backlogs)
-
-DAILY_QUOTA = BASE_QUOTA + extra_quota
-
-sent_today = sum(1 for l in leads if TODAY.isoformat() in [
-    l.get("initial date"), l.get("follow-up 1 date"), l.get("follow-up 2 date")
-])
-
-print(f"[Quota] Base: {BASE_QUOTA}, Backlogs: {backlogs}")
-print(f"[Quota] Extra: {extra_quota}, Total: {DAILY_QUOTA}")
-print(f"[Quota] Sent Today: {sent_today}")
-
-minutes_needed = DAILY_QUOTA * 7
-start = datetime.combine(TODAY, BASE_START_TIME) - timedelta(minutes=minutes_needed)
-end = datetime.combine(TODAY, END_TIME) + timedelta(minutes=(DAILY_QUOTA - BASE_QUOTA) * 7)
-if not start.time() <= NOW.time() <= min(end.time(), FINAL_END_TIME):
-    exit(0)
-
-# === Build single-send queue (one lead at a time) ===
-queue = []
-for step, label in [(3, "fu2"), (2, "fu1"), (0, "initial")]:
+def load_leads(verbose=True):
+    """
+    The leads (from LEADS_DB when set, else LEADS_FILE) with the journal replayed over
+    them and fields normalized. Returns (leads, journal events read).
+    """
+    db = lead_db()
+    if db:
+        leads = db.leads()
+        db.close()
+    else:
+        leads = read_leads(LEADS_FILE)
+    journal_events = read_events(JOURNAL_FILE)
+    unmatched = replay(leads, journal_events)
+    if verbose:
+        print(f"[Journal] Replayed {len(journal_events) - len(unmatched)} event(s) from {JOURNAL_FILE}.")
+        if unmatched:
+            print(f"[Journal] {len(unmatched)} event(s) match no lead in {LEADS_FILE}.")
     for lead in leads:
-        if label == "initial" and can_send_initial(lead):
-            queue = [("initial", lead)]
-            break
-        elif label == "fu1" and can_send_followup(lead, 2):
-            queue = [("fu1", lead)]
-            break
-        elif label == "fu2" and can_send_followup(lead, 3):
-            queue = [("fu2", lead)]
-            break
-    if queue:
-        break
+        if is_minimal_url_only(lead):
+            continue
+        for f in ["email", "email 1", "email 2", "email 3", "business name", "first name", "subject",
+                  "initial date", "follow-up 1 date", "follow-up 2 date",
+                  "initial time", "follow-up 1 time", "follow-up 2 time", "reply"]:
+            lead.setdefault(f, "")
+        if not lead["reply"]:
+            lead["reply"] = "no reply"
+        for key in list(lead):
+            if key.startswith(("message id", "in-reply-to", "references")):
+                del lead[key]
+    return leads, len(journal_events)
+
+def select_account_leads(leads, lead_key, verbose=True):
+    """Without a pool every lead is this account's; with one, only the leads assigned to it."""
+    account_leads = [lead for lead in leads
+                     if id(lead) in lead_key and (not ACCOUNT_POOL or lead_account(lead) == ACCOUNT_NAME)]
+    if ACCOUNT_POOL and verbose:
+        print(f"[Accounts] {ACCOUNT_NAME} ({FROM_EMAIL}): {len(account_leads)} of {len(lead_key)} lead(s).")
+        if ACCOUNT is ACCOUNTS[0]:
+            names = {a["name"] for a in ACCOUNTS}
+            orphaned = sum(1 for lead in leads if id(lead) in lead_key and lead_account(lead) not in names)
+            if orphaned:
+                print(f"[Accounts] {orphaned} lead(s) belong to accounts no longer in SENDER_ACCOUNTS; not sending to them.")
+    return account_leads
+
+# === Run state, bound by run() ===
+lead_key = {}  # id(lead) -> journal key
+leads_by_key = {}
+schedule = None
+pacer = None
+
+# === Journal ===
+journal_written = 0
+journal_offset = 0
+
+def journal(*events):
+    global journal_written
+    journal_written += append_events(list(events), JOURNAL_FILE)
+
+def refresh_reply_status(account_leads, lead_key, new_only=False):
+    """Run the IMAP reply / bounce scan over these leads and journal every flag it changed. Returns how many."""
+    replies_before = {id(lead): lead.get("reply") for lead in account_leads}
+    detect_reply_status(account_leads, new_only=new_only)
+    events = [reply_event(lead_key[id(lead)], lead["reply"]) for lead in account_leads
+              if lead.get("reply") != replies_before[id(lead)]]
+    journal(*events)
+    return len(events)
+
+def catch_up_journal(leads_by_key):
+    """
+    Apply reply flags that other processes (the IDLE watcher, other account workers)
+    journaled since this run loaded its leads. Returns how many were applied.
+    """
+    global journal_offset
+    events, journal_offset = read_events_since(journal_offset, JOURNAL_FILE)
+    applied = 0
+    for event in events:
+        lead = leads_by_key.get(event.get("key"))
+        if event.get("event") == "reply" and lead is not None and lead.get("reply") != event["reply"]:
+            apply_event(lead, event)
+            applied += 1
+    return applied
+
+def _presend_since(kind, lead):
+    """Start of the per-lead mailbox check window: the initial send for follow-ups, else 30 days back."""
+    if kind in ("fu1", "fu2"):
+        try:
+            return datetime.strptime(f"{lead['initial date']} {lead['initial time']}", "%Y-%m-%d %H:%M").replace(tzinfo=TIMEZONE)
+        except:
+            pass
+    return now() - timedelta(days=30)
 
-print(f"[Process] {len(queue)} message(s) to send...")
+def send_to_lead(kind, lead, prefetched=None):
+    """
+    Per-lead IMAP check immediately before send, then send and stamp the lead. Returns True if sent.
+    prefetched is this lead's earlier prefetch_reply_check() result, if any.
+    """
+    if str(lead.get("reply", "no reply")).strip().lower() != "no reply":
+        # flagged mid-run through the journal
+        print(f"[SKIP BEFORE SEND] {lead.get('email')} — {lead['reply']}")
+        return False
+    since_dt = _presend_since(kind, lead)
+
+    # Quick per-lead mailbox check (catches replies after bulk scan). A reply the prefetch
+    # already saw settles it; otherwise only mail newer than the prefetch is searched.
+    found, reason, after = prefetched or (False, "", None)
+    if not found:
+        with metrics.timed("presend"):
+            found, reason, _ = has_recent_reply_or_bounce(lead, since_dt, after)
+    if found:
+        lead["reply"] = reason
+        journal(reply_event(lead_key[id(lead)], reason))
+        print(f"[SKIP BEFORE SEND] {lead.get('email')} — {reason}")
+        return False
 
-# === Send loop with per-lead IMAP check immediately before send ===
-for kind, lead in queue:
-    try:
-        # Determine since_dt for per-lead check:
-        if kind == "initial":
-            since_dt = NOW - timedelta(days=30)
-        elif kind == "fu1":
-            try:
-                since_dt = datetime.strptime(f"{lead['initial date']} {lead['initial time']}", "%Y-%m-%d %H:%M").replace(tzinfo=TIMEZONE)
-            except:
-                since_dt = NOW - timedelta(days=30)
-        elif kind == "fu2":
-            try:
-                since_dt = datetime.strptime(f"{lead['initial date']} {lead['initial time']}", "%Y-%m-%d %H:%M").replace(tzinfo=TIMEZONE)
-            except:
-                since_dt = NOW - timedelta(days=30)
-        else:
-            since_dt = NOW - timedelta(days=30)
+    # Proceed to send according to kind
+    sent_at = now()
+    if kind == "initial":
+        subject = next_subject(initial_subjects, company=lead["business name"])
+        send_email(lead["email"], subject, lead["email 1"])
+        lead["subject"] = subject
+        lead["initial date"] = sent_at.date().isoformat()
+        lead["initial time"] = sent_at.strftime("%H:%M")
+        print(f"[SENT initial] {lead.get('email')} - subject: {subject}")
+
+    elif kind == "fu1":
+        subject = f"Re: {lead['subject']}" if lead["subject"] else "Just checking in"
+        send_email(lead["email"], subject, lead["email 2"])
+        lead["follow-up 1 date"] = sent_at.date().isoformat()
+        lead["follow-up 1 time"] = sent_at.strftime("%H:%M")
+        print(f"[SENT FU1] {lead.get('email')} - subject: {subject}")
+
+    elif kind == "fu2":
+        subject = f"Re: {lead['subject']}" if lead["subject"] else "Just circling back"
+        send_email(lead["email"], subject, lead["email 3"])
+        lead["follow-up 2 date"] = sent_at.date().isoformat()
+        lead["follow-up 2 time"] = sent_at.strftime("%H:%M")
+        print(f"[SENT FU2] {lead.get('email')} - subject: {subject}")
+    journal(sent_event(lead_key[id(lead)], kind, subject, sent_at, ACCOUNT_NAME if ACCOUNT_POOL else None))
+    return True
+
+def wait_for_next_send(lead, window_close, run_deadline):
+    """
+    Sleep until the pacer lets this lead's send go out, plus up to SEND_JITTER_SECONDS.
+    Returns False if that would overrun the window or the run budget. Single mode isn't
+    paced: its dispatch schedule spaces the sends.
+    """
+    if SEND_MODE != "batch":
+        return True
+    current = now()
+    ready = pacer.ready_at(lead, current)
+    if ready <= current:
+        return True
+    delay = (ready - current).total_seconds() + random.uniform(0, SEND_JITTER_SECONDS)
+    next_send = current + timedelta(seconds=delay)
+    if next_send > window_close:
+        print(f"[Pace] Next send at {next_send:%H:%M} would be past the window ({window_close:%H:%M}); stopping.")
+        return False
+    if run_deadline and next_send > run_deadline:
+        print(f"[Pace] Run budget of {SEND_MAX_RUN_MINUTES:g} min reached; stopping.")
+        return False
+    print(f"[Pace] Waiting {delay / 60:.1f} min before the next send...")
+    with metrics.timed("pacing"):
+        pause(delay)
+    return True
 
-        # Quick per-lead mailbox check (catches replies after bulk scan)
-        found, reason = has_recent_reply_or_bounce(lead, since_dt)
-        if found:
-            lead["reply"] = reason
-            print(f"[SKIP BEFORE SEND] {lead.get('email')} — {reason}")
-            continue
+# === Prefetched reply checks ===
+_prefetch_conn = None
 
-        # Proceed to send according to kind
-        if kind == "initial":
-            subject = next_subject(initial_subjects, company=lead["business name"])
-            send_email(lead["email"], subject, lead["email 1"])
-            lead["subject"] = subject
-            lead["initial date"] = TODAY.isoformat()
-            lead["initial time"] = NOW_TIME
-            print(f"[SENT initial] {lead.get('email')} - subject: {subject}")
-
-        elif kind == "fu1":
-            subject = f"Re: {lead['subject']}" if lead["subject"] else "Just checking in"
-            send_email(lead["email"], subject, lead["email 2"])
-            lead["follow-up 1 date"] = TODAY.isoformat()
-            lead["follow-up 1 time"] = NOW_TIME
-            print(f"[SENT FU1] {lead.get('email')} - subject: {subject}")
-
-        elif kind == "fu2":
-            subject = f"Re: {lead['subject']}" if lead["subject"] else "Just circling back"
-            send_email(lead["email"], subject, lead["email 3"])
-            lead["follow-up 2 date"] = TODAY.isoformat()
-            lead["follow-up 2 time"] = NOW_TIME
-            print(f"[SENT FU2] {lead.get('email')} - subject: {subject}")
+def _close_prefetch():
+    global _prefetch_conn
+    if _prefetch_conn is not None:
+        try:
+            _prefetch_conn.logout()
+        except Exception:
+            pass
+        _prefetch_conn = None
 
+def prefetch_reply_check(lead, since_dt):
+    """
+    Reply check for a queued lead on a second IMAP connection, which only the single
+    prefetch thread uses. Returns (found, reason, marks), or None when the check failed
+    and the lead should get a full check before its send.
+    """
+    global _prefetch_conn
+    lead_email = str(lead.get("email", "")).strip().lower()
+    if not lead_email:
+        return None
+    try:
+        if _prefetch_conn is not None and _prefetch_conn.noop()[0] != "OK":
+            _close_prefetch()
+    except Exception:
+        _close_prefetch()
+    try:
+        if _prefetch_conn is None:
+            _prefetch_conn = _open_imap()
+        with metrics.timed("prefetch"):
+            return check_lead_mailbox(_prefetch_conn, lead_email, since_dt, metric="prefetch")
     except Exception as e:
-        print(f"[Error] Failed to send {kind} to {lead.get('email')}: {e}")
+        print(f"[IMAP] Prefetch for {lead_email} failed: {e}")
+        _close_prefetch()
+        return None
 
-# === Save updated leads file (with reply flags and timestamps) ===
-print("[Save] Writing updated leads file...")
-write_multiline_ndjson(LEADS_FILE, leads)
-print("[Done] Script completed.")
+async def send_queue(queue, window_close, run_deadline):
+    """
+    Send the queue in order with the blocking IMAP / SMTP calls in worker threads.
+    While one lead is being checked and submitted, the reply checks for the next
+    SEND_PREFETCH leads run on the prefetch connection; each lead is still re-checked
+    immediately before its own send, for mail newer than its prefetch. Returns the count sent.
+    """
+    loop = asyncio.get_running_loop()
+    prefetcher = ThreadPoolExecutor(max_workers=1)
+    pending = {}
+    sent = 0
+    try:
+        for position, (kind, lead) in enumerate(queue):
+            for ahead in range(position + 1, min(len(queue), position + 1 + SEND_PREFETCH)):
+                if ahead not in pending:
+                    ahead_kind, ahead_lead = queue[ahead]
+                    pending[ahead] = loop.run_in_executor(prefetcher, prefetch_reply_check, ahead_lead,
+                                                          _presend_since(ahead_kind, ahead_lead))
+            if not await asyncio.to_thread(wait_for_next_send, lead, window_close, run_deadline):
+                break
+            prefetched = await pending.pop(position) if position in pending else None
+            catch_up_journal(leads_by_key)
+            try:
+                if await asyncio.to_thread(send_to_lead, kind, lead, prefetched):
+                    pacer.take(lead, now())
+                    sent += 1
+            except Exception as e:
+                print(f"[Error] Failed to send {kind} to {lead.get('email')}: {e}")
+            schedule.update(lead)
+
+            if SEND_MODE == "batch":
+                # the journal already holds what was sent; keep the index in step with it
+                schedule.save()
+    finally:
+        for future in pending.values():
+            future.cancel()
+        await loop.run_in_executor(prefetcher, _close_prefetch)
+        prefetcher.shutdown(wait=True)
+    return sent
+
+# === Day plan ===
+def build_plan(account_leads, lead_key, at):
+    """
+    Today's quota, sending window and paced queue for these leads as of `at`, computed
+    from the leads and the schedule index alone (no IMAP, no SMTP, nothing saved).
+    Returns a dict; "queue" is what a run at `at` would send, "in_window" whether it would.
+    """
+    today = at.date()
+    schedule = ScheduleIndex()
+    schedule.sync(((lead_key[id(lead)], lead) for lead in account_leads), today)
+    due = schedule.day_plan(today)
+    backlogs = sum(1 for step, _ in due if step != "initial")
+
+    # Removed extra 20 for recent initials - only base quota + backlogs capped at 20
+    extra_quota = min(20, backlogs)
+    daily_quota = BASE_QUOTA + extra_quota
+
+    sent_today = sum(1 for l in account_leads if today.isoformat() in [
+        l.get("initial date"), l.get("follow-up 1 date"), l.get("follow-up 2 date")
+    ])
+
+    window_close = datetime.combine(today, END_TIME, tzinfo=TIMEZONE)
+    pacer = SendPacer(ACCOUNT["rate_per_hour"], ACCOUNT["burst"])
+    remaining = max(0, daily_quota - sent_today)
+    if SEND_MODE == "batch":
+        # Pack the rest of today's quota into the window as tightly as the rate limits
+        # allow; the window opens early enough for that plan to run before BASE_START_TIME
+        pacer.replay(account_leads, at)
+        send_plan = pacer.plan(due, at, remaining, window_close)
+        minutes_needed = (send_plan[-1][0] - at).total_seconds() / 60 if send_plan else 0
+        queue = [(step, lead) for _, step, lead in send_plan]
+    else:
+        # single: one lead per run (the workflow is dispatched repeatedly), on the fixed
+        # schedule; the next due send is a peek at the heap tops
+        send_plan = []
+        minutes_needed = daily_quota * SEND_INTERVAL_MINUTES
+        next_send = schedule.next_send(today) if remaining else None
+        queue = [next_send] if next_send else []
+    window_open = datetime.combine(today, BASE_START_TIME, tzinfo=TIMEZONE) - timedelta(minutes=minutes_needed)
+    weekend = today.weekday() >= 5
+
+    return {
+        "at": at, "schedule": schedule, "pacer": pacer, "due": due,
+        "backlogs": backlogs, "extra_quota": extra_quota, "daily_quota": daily_quota, "sent_today": sent_today,
+        "send_plan": send_plan, "minutes_needed": minutes_needed,
+        "window_open": window_open, "window_close": window_close, "weekend": weekend,
+        "in_window": not weekend and window_open <= at <= window_close,
+        "queue": queue,
+    }
+
+def report_plan(day):
+    day["schedule"].report(day["due"], day["at"].date())
+    print(f"[Quota] Base: {BASE_QUOTA}, Backlogs: {day['backlogs']}")
+    print(f"[Quota] Extra: {day['extra_quota']}, Total: {day['daily_quota']}")
+    print(f"[Quota] Sent Today: {day['sent_today']}")
+    if SEND_MODE == "batch":
+        print(f"[Pace] {len(day['send_plan'])} send(s) fit the rate limits, over {day['minutes_needed']:.0f} min.")
+
+def plan(at=None):
+    """
+    Dry run: load the leads file and journal, pick this account's leads and return
+    build_plan() for `at` (default now). Opens no mail connection and writes nothing.
+    """
+    leads, _ = load_leads(verbose=False)
+    lead_key = {id(lead): key for key, lead in lead_keys(leads)}
+    account_leads = select_account_leads(leads, lead_key, verbose=False)
+    return build_plan(account_leads, lead_key, at or now())
+
+# === Run ===
+def run():
+    """One sender run: reply scan, day plan, then the paced sends. Returns the exit code."""
+    global lead_key, leads_by_key, schedule, pacer, journal_offset
+    random.shuffle(initial_subjects)
+    load_started = perf_counter()
+    journal_offset = os.path.getsize(JOURNAL_FILE) if os.path.exists(JOURNAL_FILE) else 0
+    leads, journal_count = load_leads()
+    leads_by_key = dict(lead_keys(leads))
+    lead_key = {id(lead): key for key, lead in leads_by_key.items()}
+    account_leads = select_account_leads(leads, lead_key)
+    metrics.add("load", perf_counter() - load_started, leads=len(leads), journal_events=journal_count)
+    metrics.counts.update(leads=len(leads), account_leads=len(account_leads))
+
+    # Run a bulk IMAP scan to update reply/bounce status before we pick a queue, unless an
+    # IDLE watcher (reply_watcher.py) is journaling them into this same journal file
+    if IMAP_BULK_SCAN:
+        with metrics.timed("reply_scan"):
+            refresh_reply_status(account_leads, lead_key)
+    elif catch_up_journal(leads_by_key):
+        print("[Journal] Applied reply flags journaled while loading.")
+
+    with metrics.timed("eligibility"):
+        day = build_plan(account_leads, lead_key, now())
+    schedule, pacer = day["schedule"], day["pacer"]
+    report_plan(day)
+    metrics.counts.update(due=len(day["due"]), reindexed=schedule.changed)
+
+    if not day["in_window"]:
+        imap_logout()
+        schedule.save()
+        return 0
+
+    queue = day["queue"]
+    metrics.counts["queued"] = len(queue)
+
+    print(f"[Process] {len(queue)} message(s) to send...")
+
+    # === Send loop with per-lead IMAP check immediately before send ===
+    run_deadline = day["at"] + timedelta(minutes=SEND_MAX_RUN_MINUTES) if SEND_MAX_RUN_MINUTES > 0 else None
+    send_loop_started = perf_counter()
+    sent_count = asyncio.run(send_queue(queue, day["window_close"], run_deadline))
+
+    metrics.add("send_loop", perf_counter() - send_loop_started, messages=sent_count)
+    metrics.counts["sent"] = sent_count
+    print(f"[Process] Sent {sent_count} of {len(queue)} queued message(s).")
+
+    imap_logout()
+    smtp_session.close()
+    smtp_session.report()
+
+    # === Sends and reply flags are already in the journal; fold it in with `python send_journal.py` ===
+    print(f"[Save] {journal_written} event(s) appended to {JOURNAL_FILE}.")
+    with metrics.timed("save"):
+        schedule.save()
+    metrics.counts["journal_events"] = journal_written
+    print("[Done] Script completed.")
+    return 0
+
+def preview():
+    """`python sender.py plan`: print what a run now would do, and in batch mode today's full send plan."""
+    day = plan()
+    report_plan(day)
+    if day["weekend"]:
+        print("[Window] Weekend: no sends today.")
+    else:
+        state = "open" if day["in_window"] else "closed"
+        print(f"[Window] {day['window_open']:%H:%M}-{day['window_close']:%H:%M}, {state} at {day['at']:%H:%M}.")
+    for send_at, step, lead in day["send_plan"]:
+        print(f"[Plan] {send_at:%H:%M} {step:<7} {lead.get('email')}")
+    if SEND_MODE != "batch":
+        for step, lead in day["queue"]:
+            print(f"[Plan] next    {step:<7} {lead.get('email')}")
+    return 0
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else "send"
+    if command not in ("send", "plan"):
+        print("usage: sender.py [send | plan]")
+        return 2
+    if len(ACCOUNTS) > 1 and not SENDER_ACCOUNT:
+        return run_account_workers(ACCOUNTS, args=argv)
+    if command == "plan":
+        return preview()
+    if now().weekday() >= 5:
+        print("[Skipped] Weekend detected — exiting.")
+        return 0
+    atexit.register(_write_metrics)
+    return run()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,916 @@
+"""
+Offline benchmark for sender.py.
+
+Starts local stand-ins for the IMAP and SMTP servers, seeds them with a synthetic
+mailbox (replies, bounces in several MTA layouts, newsletters with attachments), writes
+a matching synthetic leads file into a scratch directory and runs sender.py against it
+as a subprocess under a pinned clock (SENDER_NOW). Reports the per-phase timings from the
+sender's metrics file alongside the bytes / commands / connections each server saw.
+
+Configuration (environment):
+    BENCH_SIZES       comma-separated mailbox sizes, default "1000,10000" (100000 works, slowly)
+    BENCH_LEADS       number of synthetic leads, default 1000
+    BENCH_RUNS        runs per size against the same state; run 2+ are warm, default 2
+    BENCH_NEW_PER_RUN messages delivered between runs, default 1% of the size
+    BENCH_NOW         pinned clock, default the latest weekday at 15:00 Lagos time
+    BENCH_LATENCY_MS  artificial per-command server latency, default 0
+    BENCH_SEND_MODE   sender SEND_MODE, default "batch"
+    BENCH_ACCOUNTS    sending accounts in the pool (all logging in to the same stand-ins), default 1
+    BENCH_OUTPUT      optional path for the JSON results (each run includes its full metrics report)
+    BENCH_KEEP        "1" keeps the scratch directories
+"""
+import os
+import re
+import sys
+import json
+import email
+import base64
+import random
+import select
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import socketserver
+from bisect import bisect_left, bisect_right
+from functools import partial
+from time import perf_counter
+from email import policy as email_policy
+from email.utils import format_datetime, getaddresses, parsedate_to_datetime
+from datetime import datetime, timedelta, time
+from zoneinfo import ZoneInfo
+
+from lead_store import write_leads
+
+SENDER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sender.py")
+TIMEZONE = ZoneInfo("Africa/Lagos")
+BENCH_USER = "bench@toontheory.test"
+BENCH_PASSWORD = "bench"
+
+# === Fake IMAP ===
+class Mailbox:
+    """One IMAP folder. Sources are bytes or zero-arg callables rendered on first FETCH."""
+
+    def __init__(self, name, uidvalidity=1):
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.messages = []  # (uid, internal date, source, search meta or None)
+        self.next_uid = 1
+        self.cond = threading.Condition()
+
+    def append(self, source, internal_dt=None, meta=None):
+        """
+        meta, when given, is {"from", "to", "subject", "text"} (lowercased) and lets SEARCH
+        answer without rendering the message, which keeps 100k-message boxes usable.
+        """
+        with self.cond:
+            uid = self.next_uid
+            self.next_uid += 1
+            self.messages.append((uid, internal_dt, source, meta))
+            self.cond.notify_all()
+            return uid
+
+def _crlf(raw):
+    return re.sub(rb"\r?\n", b"\r\n", raw)
+
+class ParsedMessage:
+    def __init__(self, raw):
+        self.raw = _crlf(raw)
+        self.msg = email.message_from_bytes(self.raw, policy=email_policy.compat32)
+        idx = self.raw.find(b"\r\n\r\n")
+        self.header = self.raw[: idx + 4] if idx >= 0 else self.raw + b"\r\n"
+        self.text = self.raw[idx + 4:] if idx >= 0 else b""
+        try:
+            self.date = parsedate_to_datetime(self.msg.get("Date"))
+        except Exception:
+            self.date = None
+
+def _q(value):
+    if value is None:
+        return b"NIL"
+    if isinstance(value, str):
+        value = value.encode("utf-8", "surrogateescape")
+    if re.search(rb'[\x00-\x1f\x7f-\xff"\\]', value):
+        return b"{%d}\r\n" % len(value) + value
+    return b'"' + value + b'"'
+
+def _params(part):
+    params = part.get_params() or []
+    pairs = params[1:] if params else []
+    if not pairs:
+        return b"NIL"
+    return b"(" + b" ".join(_q(k) + b" " + _q(str(v)) for k, v in pairs) + b")"
+
+def _addr_list(values):
+    addrs = getaddresses(values)
+    if not addrs:
+        return b"NIL"
+    out = []
+    for name, addr in addrs:
+        local, _, host = addr.partition("@")
+        out.append(b"(" + _q(name or None) + b" NIL " + _q(local or None) + b" " + _q(host or None) + b")")
+    return b"(" + b"".join(out) + b")"
+
+def _envelope(msg):
+    def hdr(name):
+        value = msg.get(name)
+        return _q(str(value)) if value is not None else b"NIL"
+
+    def addrs(name, fallback=None):
+        values = msg.get_all(name) or (msg.get_all(fallback) if fallback else None)
+        return _addr_list([str(v) for v in values]) if values else b"NIL"
+
+    return b"(" + b" ".join([
+        hdr("Date"), hdr("Subject"), addrs("From"), addrs("Sender", "From"), addrs("Reply-To", "From"),
+        addrs("To"), addrs("Cc"), addrs("Bcc"), hdr("In-Reply-To"), hdr("Message-ID"),
+    ]) + b")"
+
+def _part_body(part):
+    if part.is_multipart():
+        raw = _crlf(part.as_bytes())
+        idx = raw.find(b"\r\n\r\n")
+        return raw[idx + 4:] if idx >= 0 else b""
+    if part.get_content_type() == "message/rfc822":
+        payload = part.get_payload()
+        if isinstance(payload, list) and payload:
+            return _crlf(payload[0].as_bytes())
+    payload = part.get_payload()
+    if isinstance(payload, str):
+        return _crlf(payload.encode("utf-8", "surrogateescape"))
+    return b""
+
+def _bodystructure(part):
+    if part.is_multipart():
+        children = b"".join(_bodystructure(p) for p in part.get_payload())
+        return b"(" + children + b" " + _q(part.get_content_subtype()) + b" " + _params(part) + b" NIL NIL)"
+    maintype, subtype = part.get_content_maintype(), part.get_content_subtype()
+    body = _part_body(part)
+    encoding = (part.get("Content-Transfer-Encoding") or "7bit").strip()
+    fields = [_q(maintype), _q(subtype), _params(part), _q(part.get("Content-ID")),
+              _q(part.get("Content-Description")), _q(encoding), b"%d" % len(body)]
+    if part.get_content_type() == "message/rfc822":
+        payload = part.get_payload()
+        inner = payload[0] if isinstance(payload, list) and payload else email.message.Message()
+        fields += [_envelope(inner), _bodystructure(inner), b"%d" % body.count(b"\n")]
+    elif maintype == "text":
+        fields.append(b"%d" % body.count(b"\n"))
+    disposition = part.get("Content-Disposition")
+    if disposition:
+        dtype = disposition.split(";")[0].strip()
+        dparams = part.get_params(header="content-disposition") or []
+        plist = b" ".join(_q(k) + b" " + _q(str(v)) for k, v in dparams[1:])
+        fields += [b"NIL", b"(" + _q(dtype) + b" " + (b"(" + plist + b")" if plist else b"NIL") + b")", b"NIL", b"NIL"]
+    else:
+        fields += [b"NIL", b"NIL", b"NIL", b"NIL"]
+    return b"(" + b" ".join(fields) + b")"
+
+def _find_part(msg, spec):
+    part = msg
+    for idx in spec.split("."):
+        n = int(idx)
+        if part.get_content_type() == "message/rfc822" and part is not msg:
+            part = part.get_payload()[0]
+        if part.is_multipart():
+            children = part.get_payload()
+            if n < 1 or n > len(children):
+                return None
+            part = children[n - 1]
+        elif n != 1:
+            return None
+    return part
+
+def _tokenize(data):
+    """Tokenize IMAP command arguments into nested lists of atoms and ("str", value) pairs."""
+    pos = 0
+    stack = [[]]
+    while pos < len(data):
+        c = data[pos]
+        if c in " \r\n":
+            pos += 1
+        elif c == "(":
+            stack.append([])
+            pos += 1
+        elif c == ")":
+            done = stack.pop()
+            stack[-1].append(done)
+            pos += 1
+        elif c == '"':
+            out = []
+            pos += 1
+            while data[pos] != '"':
+                if data[pos] == "\\":
+                    pos += 1
+                out.append(data[pos])
+                pos += 1
+            pos += 1
+            stack[-1].append(("str", "".join(out)))
+        else:
+            start = pos
+            depth = 0
+            while pos < len(data):
+                ch = data[pos]
+                if ch == "[":
+                    depth += 1
+                elif ch == "]":
+                    depth -= 1
+                elif depth == 0 and ch in " ()":
+                    break
+                pos += 1
+            stack[-1].append(data[start:pos])
+    return stack[0]
+
+def _parse_set(spec, highest):
+    """IMAP sequence set ("1:5,9,12:*") -> list of inclusive (lo, hi) ranges."""
+    ranges = []
+    for piece in spec.split(","):
+        a, _, b = piece.partition(":")
+        a = highest if a == "*" else int(a)
+        b = a if not b else (highest if b == "*" else int(b))
+        ranges.append((min(a, b), max(a, b)))
+    return ranges
+
+def _set_match(spec, value, highest):
+    return any(lo <= value <= hi for lo, hi in _parse_set(spec, highest))
+
+def _atom(tok):
+    return tok[1] if isinstance(tok, tuple) else tok
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, folders, user=None, password=None, host="127.0.0.1", port=0, latency=0.0):
+        self.folders = folders  # name -> Mailbox
+        self.user, self.password = user, password
+        self.latency = latency
+        self.cache = {}
+        self.cache_lock = threading.Lock()
+        self.stats = {"bytes_in": 0, "bytes_out": 0, "commands": 0, "connections": 0}
+        self.stats_lock = threading.Lock()
+        super().__init__((host, port), FakeIMAPHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, key, n=1):
+        with self.stats_lock:
+            self.stats[key] += n
+
+    def parsed(self, box, uid, source):
+        key = (box.name, uid)
+        with self.cache_lock:
+            hit = self.cache.get(key)
+        if hit is None:
+            hit = ParsedMessage(source() if callable(source) else source)
+            with self.cache_lock:
+                if len(self.cache) >= 512:
+                    self.cache.pop(next(iter(self.cache)))
+                self.cache[key] = hit
+        return hit
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+class FakeIMAPHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.selected = None
+        self.seen_count = 0
+        self.server.count("connections")
+
+    def send(self, data):
+        self.wfile.write(data)
+        self.server.count("bytes_out", len(data))
+
+    def readline(self):
+        line = self.rfile.readline()
+        self.server.count("bytes_in", len(line))
+        return line
+
+    def handle(self):
+        self.send(b"* OK [CAPABILITY IMAP4rev1 IDLE UIDPLUS] bench imap ready\r\n")
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            # client literals {n}
+            while re.search(rb"\{(\d+)\}\r\n$", line):
+                n = int(re.search(rb"\{(\d+)\}\r\n$", line).group(1))
+                self.send(b"+ go ahead\r\n")
+                literal = self.rfile.read(n)
+                self.server.count("bytes_in", n)
+                line = line[: line.rfind(b"{")] + _q(literal).replace(b"\r\n", b"") + self.readline()
+            text = line.decode("utf-8", "replace").rstrip("\r\n")
+            if not text.strip():
+                continue
+            self.server.count("commands")
+            if self.server.latency:
+                threading.Event().wait(self.server.latency)
+            tag, _, rest = text.partition(" ")
+            cmd, _, args = rest.partition(" ")
+            try:
+                if not self.dispatch(tag, cmd.upper(), args):
+                    return
+            except Exception as e:
+                self.send(f"{tag} BAD {type(e).__name__}: {e}\r\n".encode())
+
+    def dispatch(self, tag, cmd, args):
+        if cmd == "CAPABILITY":
+            self.send(b"* CAPABILITY IMAP4rev1 IDLE UIDPLUS\r\n")
+        elif cmd == "LOGIN":
+            user, password = [_atom(t) for t in _tokenize(args)][:2]
+            if self.server.user is not None and (user, password) != (self.server.user, self.server.password):
+                self.send(f"{tag} NO [AUTHENTICATIONFAILED] invalid credentials\r\n".encode())
+                return True
+        elif cmd in ("SELECT", "EXAMINE"):
+            box = self.server.folders.get(_atom(_tokenize(args)[0]))
+            self.selected = box
+            if box is None:
+                self.send(f"{tag} NO [NONEXISTENT] no such mailbox\r\n".encode())
+                return True
+            self.seen_count = len(box.messages)
+            self.send(b"* FLAGS (\\Seen \\Answered)\r\n")
+            self.send(b"* %d EXISTS\r\n* 0 RECENT\r\n" % len(box.messages))
+            self.send(b"* OK [UIDVALIDITY %d] UIDs valid\r\n" % box.uidvalidity)
+            self.send(b"* OK [UIDNEXT %d] next uid\r\n" % box.next_uid)
+            mode = b"READ-ONLY" if cmd == "EXAMINE" else b"READ-WRITE"
+            self.send(tag.encode() + b" OK [" + mode + b"] done\r\n")
+            return True
+        elif cmd == "NOOP":
+            self.notify_new()
+        elif cmd in ("CLOSE", "UNSELECT"):
+            self.selected = None
+        elif cmd == "LOGOUT":
+            self.send(b"* BYE logging out\r\n")
+            self.send(f"{tag} OK LOGOUT completed\r\n".encode())
+            return False
+        elif cmd == "IDLE":
+            return self.idle(tag)
+        elif cmd == "SEARCH":
+            self.search(args, use_uid=False)
+        elif cmd == "FETCH":
+            self.fetch(args, use_uid=False)
+        elif cmd == "UID":
+            sub, _, rest = args.partition(" ")
+            sub = sub.upper()
+            if sub == "SEARCH":
+                self.search(rest, use_uid=True)
+            elif sub == "FETCH":
+                self.fetch(rest, use_uid=True)
+            else:
+                self.send(f"{tag} BAD unsupported UID {sub}\r\n".encode())
+                return True
+        else:
+            self.send(f"{tag} BAD unsupported {cmd}\r\n".encode())
+            return True
+        self.send(f"{tag} OK {cmd} completed\r\n".encode())
+        return True
+
+    def notify_new(self):
+        box = self.selected
+        if box is not None and len(box.messages) != self.seen_count:
+            self.seen_count = len(box.messages)
+            self.send(b"* %d EXISTS\r\n" % len(box.messages))
+
+    def idle(self, tag):
+        box = self.selected
+        self.send(b"+ idling\r\n")
+        while True:
+            # poll with select: a read timeout would leave rfile unusable
+            if select.select([self.request], [], [], 0.05)[0]:
+                line = self.rfile.readline()
+                if not line:
+                    return False
+                self.server.count("bytes_in", len(line))
+                if line.strip().upper() == b"DONE":
+                    break
+            if box is not None:
+                with box.cond:
+                    changed = len(box.messages) != self.seen_count
+                if changed:
+                    self.notify_new()
+        self.send(f"{tag} OK IDLE terminated\r\n".encode())
+        return True
+
+    # --- SEARCH ---
+    def _date(self, key, box, uid, internal_dt, source):
+        # SINCE/BEFORE/ON use the internal date, the SENT* variants the Date header
+        if not key.startswith("SENT") and internal_dt is not None:
+            return internal_dt.date()
+        pm = self.server.parsed(box, uid, source)
+        return pm.date.date() if pm.date else None
+
+    def _haystack(self, key, box, uid, source, meta):
+        if meta is not None:
+            return meta["text" if key in ("TEXT", "BODY") else key.lower()]
+        pm = self.server.parsed(box, uid, source)
+        if key == "TEXT":
+            return pm.raw.decode("utf-8", "replace").lower()
+        if key == "BODY":
+            return pm.text.decode("utf-8", "replace").lower()
+        return " ".join(str(v) for v in (pm.msg.get_all(key.title()) or [])).lower()
+
+    def _matches(self, toks, i, ctx):
+        """Evaluate the search key at toks[i]; returns (matched, next index)."""
+        seq, uid, internal_dt, source, meta, box, highest = ctx
+        tok = toks[i]
+        if isinstance(tok, list):
+            j, ok = 0, True
+            while j < len(tok):
+                r, j = self._matches(tok, j, ctx) if ok else (False, self._skip(tok, j))
+                ok = ok and r
+            return ok, i + 1
+        key = _atom(tok).upper()
+        if key == "ALL":
+            return True, i + 1
+        if key == "OR":
+            a, j = self._matches(toks, i + 1, ctx)
+            if a:
+                return True, self._skip(toks, j)
+            return self._matches(toks, j, ctx)
+        if key == "NOT":
+            a, j = self._matches(toks, i + 1, ctx)
+            return not a, j
+        if key == "UID":
+            return _set_match(toks[i + 1], uid, highest), i + 2
+        if key in ("SINCE", "BEFORE", "ON", "SENTSINCE", "SENTBEFORE", "SENTON"):
+            wanted = datetime.strptime(_atom(toks[i + 1]), "%d-%b-%Y").date()
+            day = self._date(key, box, uid, internal_dt, source)
+            if day is None:
+                return False, i + 2
+            op = key.replace("SENT", "")
+            return {"SINCE": day >= wanted, "BEFORE": day < wanted, "ON": day == wanted}[op], i + 2
+        if key in ("FROM", "TO", "SUBJECT", "TEXT", "BODY"):
+            needle = _atom(toks[i + 1]).lower()
+            return needle in self._haystack(key, box, uid, source, meta), i + 2
+        if key in ("SEEN", "UNSEEN", "RECENT", "NEW", "OLD"):
+            return key != "SEEN", i + 1
+        if re.match(r"^[\d:*,]+$", key):
+            return _set_match(key, seq, highest), i + 1
+        raise ValueError(f"unsupported search key {key}")
+
+    def _skip(self, toks, i):
+        """Index just past the search key at toks[i], without evaluating it."""
+        tok = toks[i]
+        if isinstance(tok, list):
+            return i + 1
+        key = _atom(tok).upper()
+        if key == "OR":
+            return self._skip(toks, self._skip(toks, i + 1))
+        if key == "NOT":
+            return self._skip(toks, i + 1)
+        if key in ("UID", "SINCE", "BEFORE", "ON", "SENTSINCE", "SENTBEFORE", "SENTON",
+                   "FROM", "TO", "SUBJECT", "TEXT", "BODY"):
+            return i + 2
+        return i + 1
+
+    def search(self, args, use_uid):
+        box = self.selected
+        toks = _tokenize(args)
+        if toks and isinstance(toks[0], str) and toks[0].upper() == "CHARSET":
+            toks = toks[2:]
+        out = []
+        if box is not None:
+            msgs = list(box.messages)
+            highest = msgs[-1][0] if msgs else 0
+            for seq, (uid, internal_dt, source, meta) in enumerate(msgs, 1):
+                ctx = (seq, uid, internal_dt, source, meta, box, highest if use_uid else len(msgs))
+                j, ok = 0, True
+                while ok and j < len(toks):
+                    ok, j = self._matches(toks, j, ctx)
+                if ok:
+                    out.append(uid if use_uid else seq)
+        self.send(b"* SEARCH" + b"".join(b" %d" % n for n in out) + b"\r\n")
+
+    # --- FETCH ---
+    def fetch(self, args, use_uid):
+        box = self.selected
+        if box is None:
+            raise ValueError("no mailbox selected")
+        spec, _, items = args.partition(" ")
+        toks = _tokenize(items)
+        if len(toks) == 1 and isinstance(toks[0], list):
+            toks = toks[0]
+        names = [t.upper() for t in toks if isinstance(t, str)]
+        if use_uid and "UID" not in names:
+            names.insert(0, "UID")
+        msgs = list(box.messages)
+        uids = [m[0] for m in msgs]
+        selected = set()
+        for lo, hi in _parse_set(spec, (uids[-1] if uids else 0) if use_uid else len(msgs)):
+            if use_uid:
+                selected.update(range(bisect_left(uids, lo), bisect_right(uids, hi)))
+            else:
+                selected.update(range(max(lo, 1) - 1, min(hi, len(msgs))))
+        for index in sorted(selected):
+            seq = index + 1
+            uid, _, source, _ = msgs[index]
+            pm = self.server.parsed(box, uid, source)
+            parts = []
+            for name in names:
+                if name == "UID":
+                    parts.append(b"UID %d" % uid)
+                elif name == "FLAGS":
+                    parts.append(b"FLAGS ()")
+                elif name == "RFC822.SIZE":
+                    parts.append(b"RFC822.SIZE %d" % len(pm.raw))
+                elif name == "RFC822":
+                    parts.append(b"RFC822 {%d}\r\n" % len(pm.raw) + pm.raw)
+                elif name == "RFC822.HEADER":
+                    parts.append(b"RFC822.HEADER {%d}\r\n" % len(pm.header) + pm.header)
+                elif name in ("BODYSTRUCTURE", "BODY"):
+                    parts.append(b"BODYSTRUCTURE " + _bodystructure(pm.msg))
+                elif name.startswith(("BODY[", "BODY.PEEK[")):
+                    parts.append(self.section(pm, name))
+                else:
+                    raise ValueError(f"unsupported fetch item {name}")
+            self.send(b"* %d FETCH (" % seq + b" ".join(parts) + b")\r\n")
+
+    def section(self, pm, name):
+        m = re.match(r"BODY(?:\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?$", name, re.IGNORECASE)
+        sec, origin, count = m.group(1), m.group(2), m.group(3)
+        sec_u = sec.upper()
+        if sec_u == "":
+            data = pm.raw
+        elif sec_u == "HEADER":
+            data = pm.header
+        elif sec_u == "TEXT":
+            data = pm.text
+        elif sec_u.startswith("HEADER.FIELDS"):
+            negate = sec_u.startswith("HEADER.FIELDS.NOT")
+            wanted = set(re.search(r"\(([^)]*)\)", sec_u).group(1).split())
+            lines = [f"{k}: {v}".encode("utf-8", "surrogateescape").replace(b"\n", b"\r\n")
+                     for k, v in pm.msg.items() if (k.upper() in wanted) != negate]
+            data = b"\r\n".join(lines) + (b"\r\n\r\n" if lines else b"\r\n")
+        elif not pm.msg.is_multipart() and sec == "1":
+            data = pm.text
+        else:
+            part = _find_part(pm.msg, sec) if re.match(r"^[\d.]+$", sec) else None
+            data = _part_body(part) if part is not None else b""
+        label = "BODY[" + sec + "]"
+        if origin is not None:
+            o, c = int(origin), int(count)
+            data = data[o:o + c]
+            label += f"<{o}>"
+        return label.encode() + b" {%d}\r\n" % len(data) + data
+
+# === Fake SMTP ===
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.latency = latency
+        self.messages = []  # (mail from, rcpts, data)
+        self.stats = {"bytes_in": 0, "bytes_out": 0, "commands": 0, "connections": 0, "auths": 0}
+        self.lock = threading.Lock()
+        super().__init__((host, port), FakeSMTPHandler)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.stats[key] += n
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.count("connections")
+
+    def send(self, data):
+        self.wfile.write(data)
+        self.server.count("bytes_out", len(data))
+
+    def readline(self):
+        line = self.rfile.readline()
+        self.server.count("bytes_in", len(line))
+        return line
+
+    def handle(self):
+        self.send(b"220 bench.smtp ESMTP ready\r\n")
+        mail_from, rcpts = None, []
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            self.server.count("commands")
+            if self.server.latency:
+                threading.Event().wait(self.server.latency)
+            cmd = line.decode(errors="replace").strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.send(b"250-bench.smtp\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n")
+            elif verb == "AUTH":
+                self.server.count("auths")
+                self.send(b"235 2.7.0 Authentication successful\r\n")
+            elif verb == "MAIL":
+                mail_from, rcpts = cmd[10:].strip(" <>"), []
+                self.send(b"250 OK\r\n")
+            elif verb == "RCPT":
+                rcpts.append(cmd[8:].strip(" <>"))
+                self.send(b"250 OK\r\n")
+            elif verb == "DATA":
+                self.send(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                chunks = []
+                while True:
+                    data_line = self.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    chunks.append(data_line)
+                with self.server.lock:
+                    self.server.messages.append((mail_from, rcpts, b"".join(chunks)))
+                self.send(b"250 OK queued\r\n")
+            elif verb in ("NOOP", "RSET"):
+                self.send(b"250 OK\r\n")
+            elif verb == "QUIT":
+                self.send(b"221 Bye\r\n")
+                return
+            else:
+                self.send(b"502 Command not implemented\r\n")
+
+# === Synthetic leads and mail ===
+def synth_leads(n, today, seed=1):
+    """Leads spread over every pipeline stage, with send dates relative to `today`."""
+    rnd = random.Random(seed)
+    leads = []
+    for i in range(n):
+        lead = {
+            "website url": f"https://lead{i}.example/", "business name": f"Lead {i} Studio",
+            "first name": "Sam", "email": f"owner{i}@lead{i}.example",
+            "email 1": f"Hi Sam, a sketch idea for Lead {i}.", "email 2": "Just checking in.",
+            "email 3": "Last note from me.", "subject": "",
+            "initial date": "", "initial time": "", "follow-up 1 date": "", "follow-up 1 time": "",
+            "follow-up 2 date": "", "follow-up 2 time": "", "reply": "no reply",
+        }
+        stage = rnd.random()
+        if stage < 0.05:
+            leads.append({"website url": lead["website url"]})
+            continue
+        if stage >= 0.35:
+            initial = today - timedelta(days=rnd.randint(1, 25))
+            lead.update({"subject": "Quick idea you probably haven't seen before",
+                         "initial date": initial.isoformat(), "initial time": "14:10"})
+            if stage >= 0.65:
+                lead.update({"follow-up 1 date": (initial + timedelta(days=3)).isoformat(), "follow-up 1 time": "15:20"})
+            if stage >= 0.85:
+                lead.update({"follow-up 2 date": (initial + timedelta(days=4)).isoformat(), "follow-up 2 time": "16:30"})
+        leads.append(lead)
+    return leads
+
+# Messages are rendered from plain templates: building them with EmailMessage costs more
+# than the sender's own parsing and would dominate the 100k runs.
+def _message(sender, subject, dt, text, to=BENCH_USER):
+    return (f"From: {sender}\nTo: {to}\nSubject: {subject}\nDate: {format_datetime(dt)}\n"
+            f"MIME-Version: 1.0\nContent-Type: text/plain; charset=\"utf-8\"\n"
+            f"Content-Transfer-Encoding: 7bit\n\n{text}").encode()
+
+_ATTACHMENT = {}
+
+def _attachment_b64(size):
+    if size not in _ATTACHMENT:
+        _ATTACHMENT[size] = base64.encodebytes(random.Random(size).randbytes(size)).decode()
+    return _ATTACHMENT[size]
+
+def render_reply(lead, dt, colleague):
+    sender = f"Pat <pat@{lead['email'].split('@')[1]}>" if colleague else f"Sam <{lead['email']}>"
+    quoted = f"On {dt:%a, %d %b %Y} Toon Theory <{BENCH_USER}> wrote:\n> {lead['email 1']}"
+    if colleague:
+        quoted = f"Forwarding from {lead['email']}.\n\n" + quoted
+    return _message(sender, "Re: Quick idea you probably haven't seen before", dt,
+                    f"Thanks, not for us right now.\n\n{quoted}\n")
+
+def render_bounce(lead, dt, layout):
+    addr = lead["email"]
+    if layout == "dsn":
+        return f"""From: Mail Delivery System <MAILER-DAEMON@mx.bench.test>
+To: {BENCH_USER}
+Subject: Undelivered Mail Returned to Sender
+Date: {format_datetime(dt)}
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=delivery-status; boundary="bench"
+
+--bench
+Content-Type: text/plain
+
+This is the mail system at host mx.bench.test.
+Your message could not be delivered to one or more recipients.
+
+--bench
+Content-Type: message/delivery-status
+
+Reporting-MTA: dns; mx.bench.test
+
+Final-Recipient: rfc822; {addr}
+Action: failed
+Status: 5.1.1
+
+--bench
+Content-Type: message/rfc822
+
+From: {BENCH_USER}
+To: {addr}
+Subject: Quick idea
+
+{lead['email 1']}
+--bench--
+""".encode()
+    if layout == "postfix":
+        text = f"I'm sorry to have to inform you that your message could not\nbe delivered.\n\n<{addr}>: host mx.{addr.split('@')[1]} said: 550 5.1.1 User unknown\n"
+        return _message("MAILER-DAEMON@mx.bench.test", "Undelivered Mail Returned to Sender", dt, text)
+    if layout == "exim":
+        text = f"This message was created automatically by mail delivery software.\n\nA message that you sent could not be delivered to one or more of its\nrecipients. This is a permanent error. The following address(es) failed:\n\n  {addr}\n    No such person at this address.\n"
+        return _message("Mail Delivery System <Mailer-Daemon@mx.bench.test>", "Mail delivery failed: returning message to sender", dt, text)
+    text = f"Address not found\n\nYour message wasn't delivered to {addr} because the address couldn't be found.\n"
+    return _message("Mail Delivery Subsystem <mailer-daemon@googlemail.com>", "Delivery Status Notification (Failure)", dt, text)
+
+def render_newsletter(i, dt, attachment):
+    shop = f"shop{i % 13}.test"
+    text = f"New arrivals this week. Questions? Write to help@{shop}\n" * 20
+    alternative = (f"--alt{i}\nContent-Type: text/plain; charset=\"utf-8\"\n\n{text}\n"
+                   f"--alt{i}\nContent-Type: text/html; charset=\"utf-8\"\n\n"
+                   f"<html><body><p>New arrivals #{i}</p></body></html>\n--alt{i}--\n")
+    head = (f"From: Deals <news{i % 97}@{shop}>\nTo: {BENCH_USER}\nSubject: This week's deals #{i}\n"
+            f"Date: {format_datetime(dt)}\nMIME-Version: 1.0\n")
+    if not attachment:
+        return (head + f"Content-Type: multipart/alternative; boundary=\"alt{i}\"\n\n" + alternative).encode()
+    return (head + f"Content-Type: multipart/mixed; boundary=\"mix{i}\"\n\n"
+            f"--mix{i}\nContent-Type: multipart/alternative; boundary=\"alt{i}\"\n\n{alternative}"
+            f"--mix{i}\nContent-Type: application/pdf\nContent-Transfer-Encoding: base64\n"
+            f"Content-Disposition: attachment; filename=\"catalog.pdf\"\n\n{_attachment_b64(attachment)}"
+            f"--mix{i}--\n").encode()
+
+def populate(folders, leads, count, now, seed=2, max_age_days=40):
+    """
+    Deliver `count` synthetic messages: ~4% lead replies (a fifth from a colleague, the
+    lead only quoted in the body), ~2% bounces across DSN/Postfix/Exim/Gmail layouts, the
+    rest newsletters, some with a 40 KB attachment. ~10% land in Spam. Returns a tally.
+    """
+    rnd = random.Random(seed)
+    targets = [l for l in leads if l.get("email")]
+    tally = {"reply": 0, "bounce": 0, "noise": 0}
+    inbox, spam = folders["INBOX"], folders["Spam"]
+    for i in range(count):
+        dt = now - timedelta(seconds=rnd.randint(0, max_age_days * 86400))
+        roll = rnd.random()
+        if roll < 0.04:
+            lead = rnd.choice(targets)
+            colleague = rnd.random() < 0.2
+            source = partial(render_reply, lead, dt, colleague)
+            sender = f"pat@{lead['email'].split('@')[1]}" if colleague else lead["email"]
+            meta = {"from": sender, "to": BENCH_USER, "subject": "re: quick idea",
+                    "text": f"{sender} {BENCH_USER} {lead['email'] if colleague else ''} thanks, not for us"}
+            kind = "reply"
+        elif roll < 0.06:
+            lead = rnd.choice(targets)
+            layout = rnd.choice(["dsn", "postfix", "exim", "gmail"])
+            source = partial(render_bounce, lead, dt, layout)
+            meta = {"from": "mailer-daemon", "to": BENCH_USER, "subject": "undelivered mail",
+                    "text": f"mailer-daemon {BENCH_USER} {lead['email']} could not be delivered"}
+            kind = "bounce"
+        else:
+            attachment = 40000 if rnd.random() < 0.3 else 0
+            source = partial(render_newsletter, i, dt, attachment)
+            meta = {"from": f"news{i % 97}@shop{i % 13}.test", "to": BENCH_USER, "subject": f"this week's deals #{i}",
+                    "text": f"news{i % 97}@shop{i % 13}.test {BENCH_USER} help@shop{i % 13}.test new arrivals"}
+            kind = "noise"
+        (spam if rnd.random() < 0.1 else inbox).append(source, dt, meta)
+        tally[kind] += 1
+    return tally
+
+# === Runner ===
+def run_sender(workdir, env, timeout=3600):
+    """
+    Run sender.py in workdir. Returns (exit code, stdout lines, metrics, wall seconds) where
+    metrics is the run's SENDER_METRICS_FILE report ({} if it wasn't written).
+    """
+    metrics_path = os.path.join(workdir, "sender_metrics.json")
+    if os.path.exists(metrics_path):
+        os.remove(metrics_path)
+    t0 = perf_counter()
+    try:
+        proc = subprocess.run([sys.executable, SENDER_SCRIPT], cwd=workdir, env=dict(env, SENDER_METRICS_FILE=metrics_path),
+                              stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=timeout)
+        code, output = proc.returncode, proc.stdout
+    except subprocess.TimeoutExpired as e:
+        code, output = "timeout", e.stdout or ""
+    wall = perf_counter() - t0
+    try:
+        with open(metrics_path, "r", encoding="utf-8") as f:
+            metrics = json.load(f)
+    except (FileNotFoundError, ValueError):
+        metrics = {}
+    return code, output.splitlines(), metrics, wall
+
+def default_now():
+    day = datetime.now(TIMEZONE).date()
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return datetime.combine(day, time(15, 0), tzinfo=TIMEZONE)
+
+def bench_size(size, n_leads, runs, new_per_run, now, latency, send_mode, keep, accounts=1):
+    folders = {"INBOX": Mailbox("INBOX"), "Spam": Mailbox("Spam")}
+    leads = synth_leads(n_leads, now.date())
+    t0 = perf_counter()
+    tally = populate(folders, leads, size, now)
+    print(f"[Bench] {size} message(s) queued in {perf_counter() - t0:.1f}s: {tally}")
+
+    workdir = tempfile.mkdtemp(prefix=f"sender_bench_{size}_")
+    os.makedirs(os.path.join(workdir, "leads"))
+    write_leads(os.path.join(workdir, "leads", "scraped_leads.ndjson"), leads)
+
+    imap = FakeIMAPServer(folders, BENCH_USER, BENCH_PASSWORD, latency=latency).start()
+    smtp = FakeSMTPServer(latency=latency).start()
+    env = dict(os.environ, EMAIL_ADDRESS=BENCH_USER, EMAIL_PASSWORD=BENCH_PASSWORD, FROM_EMAIL=BENCH_USER,
+               IMAP_SERVER="127.0.0.1", IMAP_PORT=str(imap.port), IMAP_SSL="0",
+               SMTP_SERVER="127.0.0.1", SMTP_PORT=str(smtp.port), SMTP_SSL="0",
+               SEND_MODE=send_mode, SENDER_NOW=now.isoformat())
+    env.pop("SEND_MAX_RUN_MINUTES", None)
+    if accounts > 1:
+        env["SENDER_ACCOUNTS"] = json.dumps([{"name": f"a{i}", "email": BENCH_USER, "password": BENCH_PASSWORD,
+                                              "from": f"bench+a{i}@toontheory.test"} for i in range(1, accounts + 1)])
+
+    results = []
+    try:
+        for run in range(1, runs + 1):
+            if run > 1 and new_per_run:
+                populate(folders, leads, new_per_run, now, seed=run + 100, max_age_days=1)
+            imap_before, smtp_before = dict(imap.stats), dict(smtp.stats)
+            sent_before = len(smtp.messages)
+            code, lines, metrics, wall = run_sender(workdir, env)
+            # a pool run reports per account; its workers run side by side, so take the slowest per phase
+            phases = {}
+            for report in metrics.get("accounts", {"": metrics}).values():
+                for name, phase in report.get("phases", {}).items():
+                    if "." not in name:
+                        phases[name] = max(phases.get(name, 0.0), phase["seconds"])
+            result = {
+                "messages": size, "leads": n_leads, "run": run, "exit_code": code, "wall": wall,
+                "phases": phases,
+                "sent": len(smtp.messages) - sent_before,
+                "imap": {k: imap.stats[k] - imap_before[k] for k in imap.stats},
+                "smtp": {k: smtp.stats[k] - smtp_before[k] for k in smtp.stats},
+                "metrics": metrics,
+            }
+            results.append(result)
+            if code != 0:
+                print("\n".join(lines[-20:]))
+            print_result(result)
+    finally:
+        imap.shutdown()
+        smtp.shutdown()
+        if keep:
+            print(f"[Bench] Kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def print_result(r):
+    phases = ", ".join(f"{name} {r['phases'][name]:.2f}s" for name in
+                       ("load", "reply_scan", "eligibility", "send_loop", "presend", "prefetch", "save") if name in r["phases"])
+    print(f"[Bench] {r['messages']} msgs run {r['run']}: {r['wall']:.2f}s (exit {r['exit_code']}) | {phases}")
+    print(f"[Bench]   IMAP {r['imap']['commands']} cmds, {r['imap']['connections']} conns, "
+          f"{r['imap']['bytes_out'] / 1024:.0f} KiB down / {r['imap']['bytes_in'] / 1024:.0f} KiB up | "
+          f"SMTP {r['sent']} sent, {r['smtp']['connections']} conns, {r['smtp']['bytes_in'] / 1024:.0f} KiB up")
+    scan = {}
+    for report in r["metrics"].get("accounts", {"": r["metrics"]}).values():
+        for name, phase in report.get("phases", {}).items():
+            parts = name.split(".")
+            if parts[0] == "reply_scan" and len(parts) == 3:
+                scan[parts[2]] = scan.get(parts[2], 0.0) + phase["seconds"]
+    if scan:
+        print("[Bench]   reply scan: " + ", ".join(f"{step} {secs:.2f}s" for step, secs in sorted(scan.items())))
+
+if __name__ == "__main__":
+    sizes = [int(s) for s in os.environ.get("BENCH_SIZES", "1000,10000").split(",") if s.strip()]
+    n_leads = int(os.environ.get("BENCH_LEADS", "1000"))
+    runs = int(os.environ.get("BENCH_RUNS", "2"))
+    now = os.environ.get("BENCH_NOW", "").strip()
+    now = datetime.fromisoformat(now).replace(tzinfo=TIMEZONE) if now else default_now()
+    latency = float(os.environ.get("BENCH_LATENCY_MS", "0")) / 1000
+    send_mode = os.environ.get("BENCH_SEND_MODE", "batch")
+    keep = os.environ.get("BENCH_KEEP") == "1"
+    accounts = max(1, int(os.environ.get("BENCH_ACCOUNTS", "1")))
+
+    print(f"[Bench] Clock pinned at {now.isoformat()}, {n_leads} lead(s), {runs} run(s) per size, "
+          f"{accounts} account(s).")
+    results = []
+    for size in sizes:
+        new_per_run = int(os.environ.get("BENCH_NEW_PER_RUN") or max(1, size // 100))
+        results += bench_size(size, n_leads, runs, new_per_run, now, latency, send_mode, keep, accounts)
+
+    output = os.environ.get("BENCH_OUTPUT")
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"[Bench] Results written to {output}")
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+import lead_store
+from lead_store import LeadFile, LeadIndex, read_leads
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def test_index_splits_records_like_read_leads(tmp_path):
+    path = write(tmp_path / "leads.ndjson", '{"x":0}\n{"a":1}{"b":2}\n{"c":"é"} {"d":3}\nnot json\n{"e":4}\n')
+    with LeadIndex(path) as index:
+        assert [index.read(n) for n in range(len(index))] == read_leads(path)
+        assert index.skipped == 1
+
+def test_save_keeps_records_sharing_a_line(tmp_path):
+    path = write(tmp_path / "leads.ndjson", '{"x":0}\n{"a":1}{"b":2}\n{"c":3}\n')
+    leads = LeadFile(path)
+    leads.leads[0] = {"x": 9}
+    leads.save()
+    assert read_leads(path) == [{"x": 9}, {"a": 1}, {"b": 2}, {"c": 3}]
+
+def test_save_rewrites_whole_file_around_malformed_block(tmp_path):
+    path = write(tmp_path / "leads.ndjson", '{"a":1,\n{"b":2}\n{"c":3}\n')
+    leads = LeadFile(path)
+    assert leads.leads == [{"b": 2}, {"c": 3}]
+    leads.leads.insert(0, {"new": 1})
+    leads.save()
+    assert read_leads(path) == [{"new": 1}, {"b": 2}, {"c": 3}]
+    assert LeadIndex(path).skipped == 0
+
+def test_save_patches_only_changed_records(tmp_path):
+    path = write(tmp_path / "leads.ndjson", "".join(json.dumps({"n": n}, indent=2) + "\n" for n in range(3)))
+    leads = LeadFile(path)
+    leads.leads[2] = {"n": 20}
+    assert leads.save() == 1
+    text = open(path, encoding="utf-8").read()
+    assert text.startswith(json.dumps({"n": 0}, indent=2))
+    assert read_leads(path) == [{"n": 0}, {"n": 1}, {"n": 20}]
+    assert LeadIndex(path).read(2) == {"n": 20}
+
+def test_failed_save_leaves_the_file_whole(tmp_path, monkeypatch):
+    text = '{"a":1}\n{"b":2}\n{"c":3}\n'
+    path = write(tmp_path / "leads.ndjson", text)
+    leads = LeadFile(path)
+    leads.leads[1] = {"b": 20}
+
+    def crash(*args):
+        raise OSError("killed")
+    monkeypatch.setattr(lead_store.os, "replace", crash)
+    with pytest.raises(OSError):
+        leads.save()
+    assert open(path, encoding="utf-8").read() == text
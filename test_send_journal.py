@@ -0,0 +1,23 @@
+from datetime import datetime
+
+import filter_leads
+from lead_store import read_leads, write_leads
+from send_journal import JOURNAL_FILE, append_events, lead_keys, read_events, sent_event
+
+def test_filter_folds_the_journal_before_renumbering_repeats(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "leads").mkdir()
+    leads = [{"email": "ops@shared.example", "web copy": "", "n": 1},
+             {"email": "ops@shared.example", "web copy": "copy", "n": 2},
+             {"email": "ops@shared.example", "web copy": "copy", "n": 3}]
+    write_leads(filter_leads.INPUT_PATH, leads)
+    keys = [key for key, _ in lead_keys(leads)]
+    assert keys == ["ops@shared.example", "ops@shared.example#2", "ops@shared.example#3"]
+    append_events([sent_event(keys[1], "initial", "Hello", datetime(2026, 10, 14, 15, 0))])
+
+    filter_leads.filter_leads()
+
+    after = read_leads(filter_leads.INPUT_PATH)
+    assert [lead["n"] for lead in after] == [2, 3]
+    assert after[0]["initial date"] == "2026-10-14" and "initial date" not in after[1]
+    assert read_events(JOURNAL_FILE) == []
@@ -0,0 +1,60 @@
+from datetime import date
+
+import sender
+from sender import ScheduleIndex
+
+TODAY = date(2026, 10, 14)
+
+def lead(email, **fields):
+    return {"email": email, "email 1": "Hi", "email 2": "Following up", "email 3": "Last note",
+            "reply": "no reply", **fields}
+
+def test_flagged_unsent_lead_is_never_queued(tmp_path):
+    leads = [lead("a@one.example", reply="bounced (INBOX)"), lead("b@two.example")]
+    schedule = ScheduleIndex(str(tmp_path / "schedule_index.json"))
+    schedule.sync([(l["email"], l) for l in leads], TODAY)
+    assert [l["email"] for _, l in schedule.day_plan(TODAY)] == ["b@two.example"]
+    assert schedule.entries["a@one.example"]["blocked"]["initial"] == "already replied"
+
+def test_lead_flagged_after_indexing_leaves_the_queue(tmp_path):
+    leads = [lead("a@one.example"), lead("b@two.example")]
+    schedule = ScheduleIndex(str(tmp_path / "schedule_index.json"))
+    schedule.sync([(l["email"], l) for l in leads], TODAY)
+    leads[0]["reply"] = "reply in INBOX"
+    schedule.update(leads[0], TODAY)
+    assert [l["email"] for _, l in schedule.day_plan(TODAY)] == ["b@two.example"]
+
+def test_next_send_takes_the_heap_tops_in_step_priority(tmp_path):
+    monday = date(2026, 10, 12)
+    leads = [lead("a@one.example"), lead("b@two.example", **{"initial date": "2026-10-09", "initial time": "15:00"})]
+    schedule = ScheduleIndex(str(tmp_path / "schedule_index.json"))
+    schedule.sync([(l["email"], l) for l in leads], monday)
+    assert schedule.next_send(monday) == ("fu1", leads[1])
+    leads[1]["follow-up 1 date"] = monday.isoformat()
+    schedule.update(leads[1], monday)
+    assert schedule.next_send(monday) == ("initial", leads[0])
+    assert schedule.next_send(date(2026, 10, 11)) is None
+
+def test_unchanged_index_is_not_rewritten(tmp_path):
+    path = tmp_path / "schedule_index.json"
+    leads = [lead("a@one.example"), lead("b@two.example")]
+    schedule = ScheduleIndex(str(path))
+    schedule.sync([(l["email"], l) for l in leads], TODAY)
+    schedule.save()
+    mtime = path.stat().st_mtime_ns
+    schedule = ScheduleIndex(str(path))
+    schedule.sync([(l["email"], l) for l in leads], TODAY)
+    schedule.save()
+    assert path.stat().st_mtime_ns == mtime and schedule.changed == 0
+
+def test_oversized_fallback_body_is_reported_truncated():
+    items, sections = sender._body_fetch_plan(None)
+    assert sections is None and items == f"(BODY.PEEK[]<0.{sender.IMAP_BODY_BYTE_CAP + 1}>)"
+    head = b"From: mailer-daemon@example.com\r\nContent-Type: text/plain\r\n\r\n"
+    fitting = head + b"x" * (sender.IMAP_BODY_BYTE_CAP - len(head))
+    assert not sender.BodyText(fitting).truncated
+    # what the server returns for that fetch of a larger message: cap + 1 bytes
+    oversized = head + b"x" * (sender.IMAP_BODY_BYTE_CAP + 1 - len(head))
+    body = sender.BodyText(oversized)
+    assert body.truncated and body.reason == "plain"
+    assert sender._body_scan({"BODY[]<0>": oversized}, None, False) == (set(), None)
@@ -1,11 +1,12 @@
 import os
 import re
-import json
 import requests
 import urllib3
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse as original_urlparse
 
+from lead_store import LeadFile, json_field, lead_db
+
 # === Settings ===
 SCRAPED_LEADS_PATH = "leads/scraped_leads.ndjson"
 MAX_PAGES = 10
@@ -102,79 +103,61 @@ def crawl_site(base_url, max_pages=MAX_PAGES):
 
     return all_text.strip()
 
-def read_ndjson_nested(path):
-    buffer = ""
-    with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            if not line.strip():
-                if buffer.strip():
-                    try:
-                        yield json.loads(buffer)
-                    except Exception as e:
-                        print(f"❌ Bad record skipped: {e}")
-                    buffer = ""
-            else:
-                buffer += line
-        if buffer.strip():
-            try:
-                yield json.loads(buffer)
-            except Exception as e:
-                print(f"❌ Final record skipped: {e}")
-
-def write_ndjson_nested(path, records):
-    with open(path, "w", encoding="utf-8") as f:
-        for record in records:
-            json.dump(record, f, indent=2, ensure_ascii=False)
-            f.write("\n\n")
-
-def main():
-    if not os.path.exists(SCRAPED_LEADS_PATH):
-        print(f"❌ Missing: {SCRAPED_LEADS_PATH}")
-        return
+def score_lead(i, lead):
+    """Crawl the lead's site if it still needs web copy. Returns True if the lead changed."""
+    url = lead.get("website url", "").strip()
 
-    updated = []
-    changed = False
+    if "web copy" not in lead:
+        print(f"⏭️ #{i}: No 'web copy' field — skipping")
+        return False
 
-    for i, lead in enumerate(read_ndjson_nested(SCRAPED_LEADS_PATH), 1):
-        url = lead.get("website url", "").strip()
+    if not url:
+        print(f"⏭️ #{i}: No website URL")
+        return False
 
-        if "web copy" not in lead:
-            print(f"⏭️ #{i}: No 'web copy' field — skipping")
-            updated.append(lead)
-            continue
+    if lead["web copy"].strip():
+        print(f"⏭️ #{i}: Already has web copy")
+        return False
 
-        if not url:
-            print(f"⏭️ #{i}: No website URL")
-            updated.append(lead)
-            continue
+    norm_url = normalize_url(url)
+    if not norm_url:
+        print(f"⛔ #{i}: Invalid URL — skipping")
+        return False
 
-        if lead["web copy"].strip():
-            print(f"⏭️ #{i}: Already has web copy")
-            updated.append(lead)
-            continue
+    print(f"\n🌐 #{i}: {norm_url}")
+    content = crawl_site(norm_url)
+    char_count = len(content)
 
-        norm_url = normalize_url(url)
-        if not norm_url:
-            print(f"⛔ #{i}: Invalid URL — skipping")
-            updated.append(lead)
-            continue
+    if char_count < CHAR_COUNT_THRESHOLD:
+        print(f"⚠️ Not enough characters ({char_count}) — ineligible")
+        lead["web copy"] = ""
+        return False
+    print(f"✅ Eligible — {char_count} characters scraped")
+    lead["web copy"] = str(char_count)
+    return True
 
-        print(f"\n🌐 #{i}: {norm_url}")
-        content = crawl_site(norm_url)
-        char_count = len(content)
+def main():
+    db = lead_db()
+    if db:
+        # only the leads still waiting for web copy, each saved as soon as it's scored
+        changed = 0
+        for lead_id, lead in db.select(f"trim({json_field('web copy')}) = '' AND domain != ''"):
+            if score_lead(lead_id, lead):
+                with db:
+                    db.update(lead_id, lead)
+                changed += 1
+        print(f"\n📝 Updated {changed} lead(s) in {db.path}" if changed else "\n⚠️ No updates made")
+        return
 
-        if char_count < CHAR_COUNT_THRESHOLD:
-            print(f"⚠️ Not enough characters ({char_count}) — ineligible")
-            lead["web copy"] = ""
-        else:
-            print(f"✅ Eligible — {char_count} characters scraped")
-            lead["web copy"] = str(char_count)
-            changed = True
+    if not os.path.exists(SCRAPED_LEADS_PATH):
+        print(f"❌ Missing: {SCRAPED_LEADS_PATH}")
+        return
 
-        updated.append(lead)
+    store = LeadFile(SCRAPED_LEADS_PATH)
+    for i, lead in enumerate(store.leads, 1):
+        score_lead(i, lead)
 
-    if changed:
-        write_ndjson_nested(SCRAPED_LEADS_PATH, updated)
+    if store.save():
         print(f"\n📝 Updated file: {SCRAPED_LEADS_PATH}")
     else:
         print("\n⚠️ No updates made")